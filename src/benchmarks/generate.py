@@ -0,0 +1,141 @@
+"""Generate synthetic Studio5000 L5X projects with MCP AOIs, for benchmarks.
+
+    python -m benchmarks.generate out.L5X --instances 10000 --aois 20
+"""
+import argparse
+import random
+
+from core.constants import LANGUAGES, DIAGNOSTIC_WORDS
+
+BITS = 32
+VIOLATIONS = ["empty", "marker", "prefix", "language", "aoi_text"]
+OTHER_LANGUAGE = "de-DE"
+
+
+def aoi_texts(AOI_index, word, bit, languages):
+    """Return the texts of an AOI diagnostic bit per language."""
+    n = word * BITS + bit
+    kind = bit % 8
+    if kind == 7:
+        texts = {"en-GB": "DO NOT USE", "sv-SE": "ANVÄND EJ"}
+    elif kind in (5, 6):
+        # User defined slot
+        texts = {lan: f"UF_{n % 64:02d}" for lan in languages}
+    elif kind == 4:
+        # AOI specific text, without type prefix
+        texts = {"en-GB": f"Device {AOI_index} state {n}", "sv-SE": f"Enhet {AOI_index} tillstånd {n}"}
+    else:
+        dt = ["SF", "SW", "SM", "SF"][kind]
+        texts = {"en-GB": f"{dt}_{n % 64:02d} Fault {word + 1}.{bit}", "sv-SE": f"{dt}_{n % 64:02d} Fel {word + 1}.{bit}"}
+    return {lan: texts.get(lan, f"{lan} {n}") for lan in languages}
+
+def localized(lan, text):
+    return f'<LocalizedComment Lang="{lan}">\n<![CDATA[{text}]]>\n</LocalizedComment>\n'
+
+def write_AOI(f, name, revision, AOI_index, languages, mcp=True):
+    f.write(f'<AddOnInstructionDefinition Name="{name}" Revision="{revision}" ExecutePrescan="false" ExecutePostscan="false" ExecuteEnableInFalse="false">\n<Parameters>\n')
+    f.write('<Parameter Name="EnableIn" TagType="Base" DataType="BOOL" Usage="Input" Required="false" Visible="false" ExternalAccess="Read Only"/>\n')
+    if mcp:
+        f.write('<Parameter Name="cDeviceID" TagType="Base" DataType="DINT" Usage="Input" Required="false" Visible="true" ExternalAccess="Read/Write"/>\n')
+        for word, diag_word in enumerate(DIAGNOSTIC_WORDS):
+            f.write(f'<Parameter Name="iDiagnostic{word + 1}" TagType="Base" DataType="DINT" Usage="Input" Required="false" Visible="true" ExternalAccess="Read/Write">\n<Comments>\n')
+            for bit in range(BITS):
+                f.write(f'<Comment Operand=".{bit}">\n')
+                for lan, text in aoi_texts(AOI_index, word, bit, languages).items():
+                    f.write(localized(lan, text))
+                f.write('</Comment>\n')
+            f.write('</Comments>\n</Parameter>\n')
+    f.write('</Parameters>\n<LocalTags/>\n<Routines/>\n</AddOnInstructionDefinition>\n')
+
+def instance_texts(AOI_index, word, bit, languages, ins_index):
+    texts = aoi_texts(AOI_index, word, bit, languages)
+    if bit % 8 in (5, 6):
+        texts = {lan: f"{text} Instance {ins_index}" for lan, text in texts.items()}
+    return texts
+
+def write_instance(f, name, datatype, AOI_index, languages, ins_index, violation=None):
+    f.write(f'<Tag Name="{name}" TagType="Base" DataType="{datatype}" Constant="false" ExternalAccess="Read/Write">\n')
+    f.write(f'<Description>\n<![CDATA[Device {name}]]>\n</Description>\n<Comments>\n')
+    for word, diag_word in enumerate(DIAGNOSTIC_WORDS):
+        for bit in range(BITS):
+            texts = instance_texts(AOI_index, word, bit, languages, ins_index)
+            if violation is not None and word == 0:
+                if violation == "empty" and bit == 0:
+                    continue
+                if violation == "marker" and bit == 1:
+                    texts = {lan: f"{text} <@TAG>" for lan, text in texts.items()}
+                if violation == "prefix" and bit == 5:
+                    texts = {lan: f"XX {text[3:]}" for lan, text in texts.items()}
+                if violation == "language" and bit == 2:
+                    texts[OTHER_LANGUAGE] = "Fehler"
+                if violation == "aoi_text" and bit == 4:
+                    texts = {lan: f"{text} changed" for lan, text in texts.items()}
+            f.write(f'<Comment Operand=".{diag_word.upper()}.{bit}">\n')
+            for lan, text in texts.items():
+                f.write(localized(lan, text))
+            f.write('</Comment>\n')
+    f.write('</Comments>\n<Data Format="L5K">\n<![CDATA[[1,0,0,0,0]]]>\n</Data>\n')
+    f.write('<Data Format="Decorated">\n<Structure DataType="{}">\n'.format(datatype))
+    f.write('<DataValueMember Name="EnableIn" DataType="BOOL" Value="1"/>\n<DataValueMember Name="cDeviceID" DataType="DINT" Radix="Decimal" Value="0"/>\n')
+    f.write('</Structure>\n</Data>\n</Tag>\n')
+
+def write_other_tag(f, name):
+    f.write(f'<Tag Name="{name}" TagType="Base" DataType="DINT" Radix="Decimal" Constant="false" ExternalAccess="Read/Write">\n')
+    f.write('<Data Format="L5K">\n<![CDATA[0]]>\n</Data>\n<Data Format="Decorated">\n<DataValue DataType="DINT" Radix="Decimal" Value="0"/>\n</Data>\n</Tag>\n')
+
+def generate(file_path, instances=1000, AOIs=10, languages=None, violations=0.1, other_tags=None, program_instances=0, programs=1, seed=0):
+    """Write a synthetic L5X project and return the violations used per instance."""
+    rng = random.Random(seed)
+    languages = languages or LANGUAGES
+    other_tags = instances // 2 if other_tags is None else other_tags
+    AOI_names = [f"MCP_Type{i:03d}" for i in range(AOIs)]
+    res = {}
+    with open(file_path, "w", encoding="utf-8", buffering=1024 * 1024) as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+        f.write('<RSLogix5000Content SchemaRevision="1.0" SoftwareRevision="33.01" TargetName="BENCH" TargetType="Controller" ContainsContext="false" ExportOptions="NoRawData L5KData DecoratedData ForceProtectedEncoding AllProjDocTrans">\n')
+        f.write('<Controller Use="Target" Name="BENCH" ProcessorType="1756-L85E" MajorRev="33" MinorRev="11">\n<DataTypes/>\n<Modules/>\n<AddOnInstructionDefinitions>\n')
+        for i, name in enumerate(AOI_names):
+            write_AOI(f, name, f"{1 + i % 3}.{i % 5}", i, languages)
+        write_AOI(f, "MCP_Device", "1.0", 0, languages)
+        write_AOI(f, "Helper", "1.0", 0, languages, mcp=False)
+        f.write('</AddOnInstructionDefinitions>\n<Tags>\n')
+        for i in range(instances):
+            AOI_index = i % AOIs
+            violation = rng.choice(VIOLATIONS) if rng.random() < violations else None
+            name = f"Dev{i:06d}"
+            write_instance(f, name, AOI_names[AOI_index], AOI_index, languages, i, violation)
+            res[name] = violation
+            if other_tags and i % max(1, instances // other_tags) == 0:
+                write_other_tag(f, f"Var{i:06d}")
+        f.write('</Tags>\n<Programs>\n')
+        for program in range(programs):
+            name = "MainProgram" if program == 0 else f"Program{program:03d}"
+            f.write(f'<Program Name="{name}" TestEdits="false" MainRoutineName="MainRoutine" Disabled="false">\n<Tags>\n')
+            # Every program has its own tags with the same names
+            for i in range(program, program_instances, programs):
+                AOI_index = i % AOIs
+                write_instance(f, f"Local{i // programs:06d}", AOI_names[AOI_index], AOI_index, languages, i)
+            f.write('</Tags>\n<Routines>\n<Routine Name="MainRoutine" Type="RLL">\n<RLLContent>\n')
+            if program == 0:
+                for i in range(min(instances, 1000)):
+                    f.write(f'<Rung Number="{i}" Type="N">\n<Text>\n<![CDATA[{AOI_names[i % AOIs]}(Dev{i:06d});]]>\n</Text>\n</Rung>\n')
+            f.write('</RLLContent>\n</Routine>\n</Routines>\n</Program>\n')
+        f.write('</Programs>\n<Tasks/>\n</Controller>\n</RSLogix5000Content>\n')
+    return res
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic L5X project")
+    parser.add_argument("file", help="Output L5X file")
+    parser.add_argument("--instances", type=int, default=1000, help="Number of MCP AOI instances")
+    parser.add_argument("--aois", type=int, default=10, help="Number of MCP AOI definitions")
+    parser.add_argument("--languages", default=",".join(LANGUAGES), help="Comma separated languages")
+    parser.add_argument("--violations", type=float, default=0.1, help="Fraction of instances with a rule violation")
+    parser.add_argument("--other-tags", type=int, default=None, help="Number of non MCP tags (default: half the instances)")
+    parser.add_argument("--program-instances", type=int, default=0, help="Number of MCP instances in a program scope")
+    parser.add_argument("--programs", type=int, default=1, help="Number of programs the program instances are spread over")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    generate(args.file, args.instances, args.aois, args.languages.split(","), args.violations, args.other_tags, args.program_instances, args.programs, args.seed)
@@ -0,0 +1,154 @@
+"""Time and memory-profile the hot paths on synthetic projects.
+
+    python -m benchmarks.run --sizes 1000,10000,50000 --json baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+Every size runs in a fresh process, so the memory figures of one size do
+not include what was left over by the previous one.
+"""
+import argparse
+import filecmp
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.generate import generate
+from core.constants import STATUS_OK
+from core.export import export_diagnostics
+from core.fix import fix_instances
+from core.memory import current_memory, PeakMemory, format_size
+from core import l5x
+from core.validation import ValidationCache
+
+SIZES = [1000, 10000, 50000]
+PHASES = ["parse", "load_AOIs", "load_instances", "validate", "fix_all", "export", "save", "save_splice"]
+
+
+class Bench:
+    """Record the time, resident memory, peak memory and optionally Python peak memory of phases.
+
+    The peak memory of every phase is measured on its own where the peak can
+    be reset (Linux), so a phase does not report the peak of an earlier one.
+    """
+
+    def __init__(self, python_memory=False):
+        self.python_memory = python_memory
+        self.phases = {}
+
+    def run(self, phase, func, *args):
+        if self.python_memory:
+            tracemalloc.start()
+        memory = PeakMemory()
+        start = time.perf_counter()
+        res = func(*args)
+        elapsed = time.perf_counter() - start
+        self.phases[phase] = {"time": elapsed, "memory": current_memory(), "peak": memory.peak()}
+        if self.python_memory:
+            self.phases[phase]["python_peak"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return res
+
+def bench_file(file_path, python_memory=False):
+    """Run every phase once on a project and return the measures per phase."""
+    bench = Bench(python_memory)
+    tree = bench.run("parse", l5x.parse_file, file_path)
+    xml_root = tree.getroot()
+    AOIs = bench.run("load_AOIs", l5x.load_AOIs, xml_root)
+    instances = bench.run("load_instances", l5x.load_instances, xml_root, AOIs)
+    validation = ValidationCache(AOIs, instances)
+    statuses = bench.run("validate", validation.validate_all)
+    ok_instances = [ins_name for ins_name, status in statuses.items() if status == STATUS_OK]
+    saved = l5x.SavedFile(file_path, l5x.instance_versions(instances))
+    bench.run("fix_all", fix_instances, instances, validation, ok_instances)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bench.run("export", export_diagnostics, os.path.join(temp_dir, "export.txt"), instances)
+        bench.run("save", l5x.write_file, tree, os.path.join(temp_dir, "save.L5X"))
+        tags = [(ins_name, l5x.tag_bytes(instances[ins_name]["XML_node"])) for ins_name in saved.changed(instances)]
+        bench.run("save_splice", l5x.splice_file, file_path, tags, os.path.join(temp_dir, "splice.L5X"))
+        resave_identical = fix_again(os.path.join(temp_dir, "splice.L5X"), os.path.join(temp_dir, "resave.L5X"))
+    # Every rise of the process peak is reported by the phase that caused it
+    peaks = [measure["peak"] for measure in bench.phases.values() if measure["peak"] is not None]
+    return {"instances": len(instances), "file_size": os.path.getsize(file_path), "peak_memory": max(peaks, default=None),
+            "resave_identical": resave_identical, "phases": bench.phases}
+
+def fix_again(file_path, resave_path):
+    """Fix all a fixed project again and save it, return True if no tag changed and the saved file is byte identical."""
+    tree, AOIs, instances, _ = l5x.load_project(file_path)
+    validation = ValidationCache(AOIs, instances)
+    saved = l5x.SavedFile(file_path, l5x.instance_versions(instances))
+    fix_instances(instances, validation, [ins_name for ins_name, status in validation.validate_all().items() if status == STATUS_OK])
+    tags = [(ins_name, l5x.tag_bytes(instances[ins_name]["XML_node"])) for ins_name in saved.changed(instances)]
+    l5x.splice_file(file_path, tags, resave_path)
+    return not tags and filecmp.cmp(file_path, resave_path, shallow=False)
+
+def get_project(size, data_dir, seed=0):
+    """Return a synthetic project of the given size, generating it the first time."""
+    file_path = os.path.join(data_dir, f"bench_{size}_{seed}.L5X")
+    if not os.path.exists(file_path):
+        generate(file_path + ".tmp", instances=size, seed=seed)
+        os.replace(file_path + ".tmp", file_path)
+    return file_path
+
+def run(sizes, data_dir, python_memory=False):
+    res = {}
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        file_path = get_project(size, data_dir)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            res[str(size)] = executor.submit(bench_file, file_path, python_memory).result()
+        print_result(size, res[str(size)])
+    return res
+
+def print_result(size, result):
+    print(f"\n{size} instances, {format_size(result['file_size'])} file, peak memory {format_size(result['peak_memory'])}")
+    for phase in PHASES:
+        measure = result["phases"][phase]
+        line = f"  {phase:<16}{measure['time']:>9.3f} s   rss {format_size(measure['memory']):>10}   peak {format_size(measure.get('peak')):>10}"
+        if "python_peak" in measure:
+            line += f"   python peak {format_size(measure['python_peak']):>10}"
+        print(line)
+    if not result["resave_identical"]:
+        print("  Error: Fix all on the fixed project changed the saved file")
+
+def compare(results, baseline, threshold):
+    """Return the phases that got slower than the baseline by more than threshold."""
+    regressions = []
+    for size, result in results.items():
+        if size not in baseline:
+            continue
+        for phase, measure in result["phases"].items():
+            before = baseline[size]["phases"].get(phase, {}).get("time")
+            if before and measure["time"] > before * (1 + threshold):
+                regressions.append((size, phase, before, measure["time"]))
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the MCP Diagnostics Tool hot paths")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES), help="Comma separated number of instances")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "mcp_bench"), help="Where the generated projects are kept")
+    parser.add_argument("--python-memory", action="store_true", help="Trace Python allocations per phase (slower)")
+    parser.add_argument("--json", metavar="FILE", help="Write the results to a JSON file")
+    parser.add_argument("--compare", metavar="FILE", help="Compare with a previous JSON result")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown reported as regression (default: 0.2)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = run([int(size) for size in args.sizes.split(",")], args.data_dir, args.python_memory)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for size, phase, before, after in regressions:
+            print(f"Regression: {phase} at {size} instances took {after:.3f} s, baseline {before:.3f} s")
+    failed = [size for size, result in results.items() if not result["resave_identical"]]
+    sys.exit(1 if regressions or failed else 0)
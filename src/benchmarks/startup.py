@@ -0,0 +1,98 @@
+"""Time the headless startup: imports and first load and validation of a reference file.
+
+    python -m benchmarks.startup --json startup.json
+    python -m benchmarks.startup --compare startup.json
+
+Every run is a fresh Python process, so nothing is imported beforehand.
+The run fails if loading and validating imported the GUI (dearpygui).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import get_project, compare
+
+PHASES = ["import", "load", "validate", "process"]
+SIZE = 1000  # Instances of the generated reference project
+
+# Run in the child process, with only the modules needed to load and validate
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from core import l5x
+from core.validation import ValidationCache
+imported = time.perf_counter()
+tree, AOIs, instances, stats = l5x.load_project(sys.argv[1], sys.argv[2] == "stream")
+loaded = time.perf_counter()
+ValidationCache(AOIs, instances).validate_all()
+validated = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "load": loaded - imported,
+    "validate": validated - loaded,
+    "gui_modules": sorted(name for name in sys.modules if name.split(".")[0] in ("dearpygui", "gui")),
+}))
+"""
+
+
+def run_once(file_path, streaming=False):
+    """Start a Python process that loads and validates the file, return its times per phase."""
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD, file_path, "stream" if streaming else "dom"],
+                            cwd=src_dir, capture_output=True, text=True, check=True).stdout
+    res = json.loads(output)
+    res["process"] = time.perf_counter() - start
+    return res
+
+def run(file_path, repeat=5, streaming=False):
+    """Return the median time of every phase over repeated runs."""
+    runs = [run_once(file_path, streaming) for _ in range(repeat)]
+    gui_modules = sorted({name for res in runs for name in res["gui_modules"]})
+    if gui_modules:
+        raise RuntimeError(f"the GUI was imported while loading: {', '.join(gui_modules)}")
+    return {
+        "file": file_path,
+        "file_size": os.path.getsize(file_path),
+        "runs": repeat,
+        "phases": {phase: {"time": statistics.median(res[phase] for res in runs)} for phase in PHASES},
+    }
+
+def print_result(result):
+    print(f"\nStartup of {os.path.basename(result['file'])}, median of {result['runs']} runs")
+    for phase in PHASES:
+        print(f"  {phase:<16}{result['phases'][phase]['time']:>9.3f} s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the headless startup of the MCP Diagnostics Tool")
+    parser.add_argument("--file", help="Reference L5X file (default: a generated project of 1000 instances)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "mcp_bench"), help="Where the generated projects are kept")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs (default: 5)")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming loader")
+    parser.add_argument("--json", metavar="FILE", help="Write the results to a JSON file")
+    parser.add_argument("--compare", metavar="FILE", help="Compare with a previous JSON result")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown reported as regression (default: 0.2)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    file_path = args.file
+    if file_path is None:
+        os.makedirs(args.data_dir, exist_ok=True)
+        file_path = get_project(SIZE, args.data_dir)
+    results = {"startup": run(file_path, args.repeat, args.stream)}
+    print_result(results["startup"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for _, phase, before, after in regressions:
+            print(f"Regression: {phase} took {after:.3f} s, baseline {before:.3f} s")
+        sys.exit(1 if regressions else 0)
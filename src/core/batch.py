@@ -0,0 +1,84 @@
+
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from core.constants import VERSION, STATUS_OK
+from core.l5x import load_project
+from core.validation import ValidationCache, status_from_color, color_name
+
+CSV_FIELDS = ["file", "instance", "datatype", "status", "color", "red", "orange", "error"]
+
+
+def check_file(file_path, streaming=False, library=None):
+    """Validate all MCP AOI instances of an L5X file without any GUI."""
+    result = {"file": file_path, "AOIs": 0, "instances": [], "error": None}
+    try:
+        _, AOIs, instances, stats = load_project(file_path, streaming, library=library)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    result["AOIs"] = len(AOIs)
+    result["load"] = stats
+    cache = ValidationCache(AOIs, instances)
+    color_counts = cache.color_counts()
+    for ins_name, ins_data in instances.items():
+        instance_color = cache.color(ins_name)
+        red, orange = color_counts[ins_name]
+        result["instances"].append({
+            "instance": ins_name,
+            "datatype": ins_data["datatype"],
+            "status": status_from_color(instance_color),
+            "color": color_name(instance_color),
+            "red": red,
+            "orange": orange,
+        })
+    return result
+
+def find_files(directory, recursive=True):
+    """Return the L5X files found in a directory, sorted by path."""
+    res = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(".l5x"):
+                res.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return sorted(res)
+
+def check_directory(directory, workers=None, recursive=True, streaming=False, library=None):
+    """Validate every L5X file of a directory across a process pool."""
+    files = find_files(directory, recursive)
+    check = partial(check_file, streaming=streaming, library=library)
+    if workers == 1 or len(files) <= 1:
+        return [check(file_path) for file_path in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(check, files))
+
+def summarize(results):
+    instances = [ins for res in results for ins in res["instances"]]
+    return {
+        "version": VERSION,
+        "files": len(results),
+        "failed_files": sum(1 for res in results if res["error"]),
+        "instances": len(instances),
+        "issues": sum(1 for ins in instances if ins["status"] != STATUS_OK),
+        "AOI_conflicts": sum(len(res.get("load", {}).get("library", {}).get("conflicts", [])) for res in results),
+    }
+
+def write_report(results, report_path):
+    """Write the results as JSON or CSV, depending on the report file extension."""
+    if report_path.lower().endswith(".csv"):
+        with open(report_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for res in results:
+                if res["error"]:
+                    writer.writerow({"file": res["file"], "error": res["error"]})
+                for ins in res["instances"]:
+                    writer.writerow({"file": res["file"], **ins})
+    else:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summarize(results), "files": results}, f, indent=2, ensure_ascii=False)
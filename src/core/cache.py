@@ -0,0 +1,161 @@
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+
+from core.constants import VERSION
+from core.comments import CachedComments
+from core.model import StringTable, AOITexts, InstanceTexts
+from core.profiling import profiler
+from core.validation import color_name, color_from_name
+
+DEFAULT_SIZE_LIMIT = 512 * 1024 * 1024
+FORMAT = 4  # Increased when the layout of the cached data changes
+CACHE_VERSION = f"{VERSION}/{FORMAT}"
+
+
+def default_cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "MCPDiagnosticsTool")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "mcp_diagnostics_tool")
+
+def file_hash(file_path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def project_data(AOIs, instances, validation, AOI_conflicts=()):
+    """Return the data of a loaded and validated project to be stored in the cache.
+
+    Instances keep only the texts that differ from their AOI. AOI_conflicts
+    are the AOIs that differed from the AOI library, as in the load stats.
+    """
+    return {
+        "AOIs": {AOI_name: AOI.to_dict() for AOI_name, AOI in AOIs.items()},
+        "AOI_conflicts": list(AOI_conflicts),
+        "instances": {
+            ins_name: {
+                "datatype": ins_data["datatype"],
+                "scope": ins_data["scope"],
+                "comments": len(ins_data["comments"]),
+                "texts": validation.get_texts(ins_name).to_dict(),
+                "color": color_name(validation.color(ins_name)),
+            }
+            for ins_name, ins_data in instances.items()
+        },
+    }
+
+def cached_project(data):
+    """Return (AOIs, instances, colors) from cached data, without any XML."""
+    strings = StringTable()
+    AOIs = {AOI_name: AOITexts.from_dict(AOI_name, AOI, strings) for AOI_name, AOI in data["AOIs"].items()}
+    instances = {}
+    colors = {}
+    for ins_name, ins_data in data["instances"].items():
+        texts = InstanceTexts.from_dict(AOIs[ins_data["datatype"]], ins_data["texts"])
+        instances[ins_name] = {
+            "datatype": ins_data["datatype"],
+            "scope": ins_data["scope"],
+            "XML_node": None,
+            "comments": CachedComments(texts, ins_data["comments"]),
+            "tree_node": 0,
+        }
+        colors[ins_name] = color_from_name(ins_data["color"])
+    return AOIs, instances, colors
+
+class ProjectCache:
+    """On-disk cache of loaded projects, keyed by file content hash.
+
+    Entries store the AOIs, the instance list with their diagnostics and the
+    validation color of every instance. Reopening an unchanged file (same
+    path, size and modification time) skips hashing; a moved or touched file
+    is still found by its hash. When the cache grows over size_limit the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=None, size_limit=DEFAULT_SIZE_LIMIT):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.size_limit = size_limit
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.db_path = os.path.join(self.cache_dir, "projects.sqlite")
+        with self.connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS projects (
+                hash TEXT PRIMARY KEY, path TEXT, size INTEGER, mtime REAL,
+                version TEXT, data BLOB, bytes INTEGER, last_used REAL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS projects_path ON projects (path, size, mtime)")
+
+    @contextmanager
+    def connect(self):
+        # One connection per call, so the cache can be used from worker threads
+        db = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, file_path):
+        """Return (data, key) of a file, data is None if it is not cached.
+
+        The key is the content hash, size and mtime of the file; pass it to
+        put after a miss, so the file is not hashed again.
+        """
+        with profiler.span("cache_read") as counts:
+            stat = os.stat(file_path)
+            path = os.path.abspath(file_path)
+            with self.connect() as db:
+                row = db.execute("SELECT hash, data FROM projects WHERE path = ? AND size = ? AND mtime = ? AND version = ?",
+                                 (path, stat.st_size, stat.st_mtime, CACHE_VERSION)).fetchone()
+                if row is None:
+                    content_hash = file_hash(file_path)
+                    row = db.execute("SELECT hash, data FROM projects WHERE hash = ? AND version = ?", (content_hash, CACHE_VERSION)).fetchone()
+                else:
+                    content_hash = row[0]
+                key = (content_hash, stat.st_size, stat.st_mtime)
+                if row is None:
+                    counts["hit"] = False
+                    return None, key
+                db.execute("UPDATE projects SET path = ?, size = ?, mtime = ?, last_used = ? WHERE hash = ?",
+                           (path, stat.st_size, stat.st_mtime, time.time(), content_hash))
+            counts.update(hit=True, bytes=len(row[1]))
+            return json.loads(zlib.decompress(row[1])), key
+
+    def put(self, file_path, data, key=None):
+        """Store the data of a file and evict the least recently used entries over the size limit.
+
+        The file is hashed unless the key returned by get is given and the file did not change since.
+        """
+        with profiler.span("cache_write") as counts:
+            stat = os.stat(file_path)
+            if key is None or key[1:] != (stat.st_size, stat.st_mtime):
+                key = (file_hash(file_path), stat.st_size, stat.st_mtime)
+            blob = zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), 6)
+            counts["bytes"] = len(blob)
+            with self.connect() as db:
+                db.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (key[0], os.path.abspath(file_path), stat.st_size, stat.st_mtime,
+                            CACHE_VERSION, blob, len(blob), time.time()))
+                self.evict(db)
+
+    def evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM projects").fetchone()[0]
+        for content_hash, size in db.execute("SELECT hash, bytes FROM projects ORDER BY last_used").fetchall():
+            if total <= self.size_limit:
+                break
+            db.execute("DELETE FROM projects WHERE hash = ?", (content_hash,))
+            total -= size
+
+    def clear(self):
+        with self.connect() as db:
+            db.execute("DELETE FROM projects")
+        with self.connect() as db:
+            db.execute("VACUUM")
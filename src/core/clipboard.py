@@ -0,0 +1,63 @@
+"""Copy and paste of the diagnostic texts of many instances at once, as tab separated rows.
+
+Every row is keyed by instance, operand and language, so a paste writes each
+text back where it belongs whatever the order of the rows, and rows can be
+sorted, filtered or translated in a spreadsheet in between.
+"""
+from core.constants import LANGUAGES
+from core.profiling import profiler
+from core.progress import report
+
+HEADER = ["INSTANCE", "OPERAND", "LANGUAGE", "TEXT", "AOI TEXT"]
+
+
+def copy_instances(validation, ins_names):
+    """Return the texts of the instances as tab separated rows, after a header line."""
+    with profiler.span("copy_instances", instances=len(ins_names)) as counts:
+        lines = ["\t".join(HEADER)]
+        for ins_name in ins_names:
+            texts = validation.get_texts(ins_name)
+            for row, diag in enumerate(texts.AOI.diags):
+                for lan, text_local, text_aoi in texts.row_texts(row):
+                    lines.append(f"{ins_name}\t{diag}\t{lan}\t{text_local}\t{text_aoi}")
+        counts["rows"] = len(lines) - 1
+    return "\n".join(lines) + "\n"
+
+def paste_instances(instances, validation, text, progress=None):
+    """Apply copied rows to the instance comments, matched by instance, operand and language.
+
+    Rows of unknown instances or operands are skipped, as well as empty
+    texts and languages not in LANGUAGES. Texts are compared with those of
+    the instance before the paste, so only the cells that change are
+    written. Returns (summary, names of the instances that changed).
+    """
+    summary = {"rows": 0, "applied": 0, "unknown": 0}
+    changed = set()
+    before = {}  # ins_name -> InstanceTexts before the paste
+    with profiler.span("paste_instances") as counts:
+        lines = text.splitlines()
+        for i, line in enumerate(lines):
+            if i % 1000 == 0:
+                report(progress, "paste", i / len(lines))
+            cells = line.split("\t")
+            if len(cells) < 4 or cells[0] == HEADER[0]:
+                continue
+            summary["rows"] += 1
+            ins_name, diag, lan, new_text = cells[:4]
+            diag = diag.lower()
+            ins_data = instances.get(ins_name)
+            if ins_data is None or diag not in validation.AOIs[ins_data["datatype"]].rows:
+                summary["unknown"] += 1
+                continue
+            if lan not in LANGUAGES or new_text == "":
+                continue
+            texts = before.get(ins_name)
+            if texts is None:
+                texts = before[ins_name] = validation.get_texts(ins_name)
+            if texts.get_text(diag, lan) != new_text:
+                ins_data["comments"].set_text(diag, lan, new_text)
+                summary["applied"] += 1
+                changed.add(ins_name)
+        summary["instances"] = len(changed)
+        counts.update(summary)
+    return summary, changed
@@ -0,0 +1,121 @@
+"""Validation of many instances at once, as NumPy array operations.
+
+The texts of the instances of an AOI type are laid out as an (instances,
+diagnostics, languages) array of text ids of the project StringTable, and
+the rules of validation.classify_row are evaluated on whole arrays, with
+the flags of every distinct text computed only once. NumPy is optional,
+without it the instances are validated one by one. It is imported on first
+use by available(), since it takes a good part of the startup time.
+"""
+from itertools import chain
+
+from core.constants import LANGUAGES, DIAG_TYPES, USER_DIAG_TEXTS, NOT_ALLOWED_TEXTS, COLOR_WHITE, COLOR_ORANGE, COLOR_RED
+
+WHITE, ORANGE, RED = 0, 1, 2
+CODE_COLORS = [COLOR_WHITE, COLOR_ORANGE, COLOR_RED]
+# Sets for the lookups of every distinct text
+TYPE_PREFIXES = frozenset(DIAG_TYPES)
+USER_TEXTS = frozenset(USER_DIAG_TEXTS)
+np = None
+missing = False  # NumPy could not be imported
+
+
+def available():
+    global np, missing
+    if np is None and not missing:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            missing = True
+    return np is not None
+
+class TextFlags:
+    """Rule flags of every text of a StringTable, extended as the table grows."""
+
+    def __init__(self, strings):
+        self.strings = strings
+        self.count = 0
+        self.prefixes = {}
+        self.marker = np.zeros(0, bool)       # Includes the "<@" marker
+        self.not_allowed = np.zeros(0, bool)  # In NOT_ALLOWED_TEXTS
+        self.no_type = np.zeros(0, bool)      # Does not start with a DIAG_TYPES prefix
+        self.user_text = np.zeros(0, bool)    # In USER_DIAG_TEXTS
+        self.prefix = np.zeros(0, np.int32)   # Id of the first two characters
+
+    def update(self):
+        texts = self.strings.texts[self.count:]
+        if not texts:
+            return self
+        count = len(texts)
+        self.marker = np.concatenate([self.marker, np.fromiter(("<@" in text for text in texts), bool, count)])
+        self.not_allowed = np.concatenate([self.not_allowed, np.fromiter((text in NOT_ALLOWED_TEXTS for text in texts), bool, count)])
+        self.no_type = np.concatenate([self.no_type, np.fromiter((text[:2] not in TYPE_PREFIXES for text in texts), bool, count)])
+        self.user_text = np.concatenate([self.user_text, np.fromiter((text in USER_TEXTS for text in texts), bool, count)])
+        prefix = np.fromiter((self.prefixes.setdefault(text[:2], len(self.prefixes)) for text in texts), np.int32, count)
+        self.prefix = np.concatenate([self.prefix, prefix])
+        self.count += count
+        return self
+
+def validate(texts_list, flags):
+    """Validate InstanceTexts of one StringTable.
+
+    Returns three arrays with one entry per instance: its color code (WHITE,
+    ORANGE or RED) and its number of red and of orange cells.
+    """
+    flags.update()
+    count = len(texts_list)
+    red = np.zeros(count, np.int64)
+    orange = np.zeros(count, np.int64)
+    by_AOI = {}
+    for i, texts in enumerate(texts_list):
+        by_AOI.setdefault(texts.AOI, []).append(i)
+    for AOI, positions in by_AOI.items():
+        group = [texts_list[i] for i in positions]
+        red[positions], orange[positions] = validate_AOI(AOI, group, flags)
+    colors = np.where(red > 0, RED, np.where(orange > 0, ORANGE, WHITE)).astype(np.int8)
+    return colors, red, orange
+
+def validate_AOI(AOI, group, flags):
+    """Return the number of red and orange cells of InstanceTexts of the same AOI."""
+    count = len(group)
+    rows, cols = len(AOI.diags), len(AOI.languages)
+    aoi = np.asarray(AOI.cells, np.int32)
+    present = aoi >= 0
+    aoi = np.where(present, aoi, 0)
+    # Instance texts, the AOI texts with the differences of every instance
+    local = np.tile(aoi, (count, 1))
+    sizes = [len(texts.diffs) for texts in group]
+    cells = np.fromiter(chain.from_iterable(texts.diffs.keys() for texts in group), np.int64, sum(sizes))
+    ids = np.fromiter(chain.from_iterable(texts.diffs.values() for texts in group), np.int32, sum(sizes))
+    local[np.repeat(np.arange(count), sizes), cells] = ids
+    local = local.reshape(count, rows, cols)
+    aoi = aoi.reshape(rows, cols)
+    present = present.reshape(rows, cols)
+    lan_ok = np.array([lan in LANGUAGES for lan in AOI.languages])
+    # Languages the AOI does not have: red unless supported and empty
+    extra = [(i, AOI.rows[diag], lan in LANGUAGES, text_id)
+             for i, texts in enumerate(group) for diag, lans in texts.extra.items() for lan, text_id in lans.items()]
+    extra_pos = np.array([e[0] for e in extra], np.int64)
+    extra_row = np.array([e[1] for e in extra], np.int64)
+    extra_ok = np.array([e[2] for e in extra], bool)
+    extra_id = np.array([e[3] for e in extra], np.int32)
+    # Check if language description is consistent
+    differs = present & (local != aoi)
+    lan_desc_count = (differs & (local != 0)).sum(axis=2)
+    lans = np.tile(present.sum(axis=1), (count, 1))
+    np.add.at(lan_desc_count, (extra_pos, extra_row), extra_id != 0)
+    np.add.at(lans, (extra_pos, extra_row), 1)
+    both_lan_exist = ((lan_desc_count == 0) | (lan_desc_count == lans))[:, :, None]
+    # The rules of classify_row, in the same order
+    marker = flags.marker[local]
+    is_red = present & (~lan_ok | marker)
+    rest = present & lan_ok & ~marker & differs
+    is_red |= rest & ~both_lan_exist
+    rest &= both_lan_exist
+    is_orange = rest & (local == 0)
+    rest &= local != 0
+    is_red |= rest & (flags.not_allowed[aoi] | flags.no_type[aoi] | (flags.user_text[aoi] & (flags.prefix[local] != flags.prefix[aoi])))
+    red = is_red.sum(axis=(1, 2))
+    red += np.bincount(extra_pos, weights=~extra_ok | (extra_id != 0), minlength=count).astype(np.int64)
+    return red, is_orange.sum(axis=(1, 2))
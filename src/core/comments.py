@@ -0,0 +1,229 @@
+
+from lxml import etree
+
+from core.constants import DIAGNOSTIC_WORDS, LANGUAGES
+from core.model import InstanceTexts
+
+
+def comment_text(loc):
+    return (loc.text or "").replace("\n", "")
+
+class CommentIndex:
+    """Index of the diagnostic comments of an instance tag by operand.
+
+    Operands are stored lower-cased and without the leading dot, like the
+    diagnostic keys of the AOIs ("idiagnostic1.0"). A language is found
+    among the few LocalizedComment children of its operand, rather than
+    keeping an element per (operand, language), so the index does not hold
+    a proxy for every text of the project. All changes to the comments of
+    the tag must go through this class to keep the index valid.
+    The version is increased on every change, so cached results based on the
+    comments can tell when they are stale. With a journal, every change is
+    also recorded there to be undone.
+    """
+
+    journal = None  # Journal recording the changes, set by the GUI
+
+    def __init__(self, xml_node, AOI=None):
+        self.xml_node = xml_node
+        self.version = 0
+        self.comments = xml_node.find("Comments")
+        self.operands = {}  # diag -> Comment element
+        self._texts = None  # InstanceTexts, read at _texts_version
+        self._texts_version = 0
+        if self.comments is not None:
+            for comment in self.comments.iterchildren("Comment"):
+                diag = comment.attrib.get("Operand").lower()[1:]
+                if diag in self.operands or not any(word in diag for word in DIAGNOSTIC_WORDS):
+                    continue
+                self.operands[diag] = comment
+        if AOI is not None:
+            # Read the texts while the tag is at hand
+            self.texts(AOI)
+
+    def __contains__(self, diag):
+        return diag in self.operands
+
+    def __len__(self):
+        return len(self.operands)
+
+    def get_comment(self, diag):
+        return self.operands.get(diag)
+
+    def get_localized(self, diag, lan):
+        comment = self.operands.get(diag)
+        if comment is not None:
+            for loc in comment.iterchildren("LocalizedComment"):
+                if loc.get("Lang") == lan:
+                    return loc
+        return None
+
+    def iter_localized(self, diag):
+        """Yield (lan, LocalizedComment element) of an operand, the first one of each language only."""
+        comment = self.operands.get(diag)
+        if comment is None:
+            return
+        seen = set()
+        for loc in comment.iterchildren("LocalizedComment"):
+            lan = loc.get("Lang")
+            if lan not in seen:
+                seen.add(lan)
+                yield lan, loc
+
+    def languages(self, diag):
+        return [lan for lan, _ in self.iter_localized(diag)]
+
+    def get_text(self, diag, lan, default=""):
+        loc = self.get_localized(diag, lan)
+        return comment_text(loc) if loc is not None else default
+
+    def diagnostics(self):
+        """Return the diagnostic texts of the instance, like get_instance_diagnostics."""
+        res = {}
+        for diag in self.operands:
+            texts = {lan: "" for lan in LANGUAGES}
+            for lan, loc in self.iter_localized(diag):
+                texts[lan] = comment_text(loc)
+            res[diag] = texts
+        return res
+
+    def texts(self, AOI):
+        """Return the diagnostic texts of the instance as InstanceTexts of its AOI.
+
+        They are read from the tag again only after the comments changed.
+        """
+        if self._texts is None or self._texts_version != self.version or self._texts.AOI is not AOI:
+            self._texts = InstanceTexts.from_texts(AOI, (
+                (diag, lan, comment_text(loc))
+                for diag in self.operands if diag in AOI.rows
+                for lan, loc in self.iter_localized(diag)
+            ))
+            self._texts_version = self.version
+        return self._texts
+
+    def ensure_comments(self):
+        """Return the Comments node of the tag, creating it if missing."""
+        if self.comments is None:
+            xml_node = self.xml_node
+            self.comments = etree.Element("Comments")
+            description = xml_node.find("Description")
+            alarm_conditions = xml_node.find("AlarmConditions")
+            if description is not None:
+                index = xml_node.index(description) + 1
+                xml_node.insert(index, self.comments)
+            elif alarm_conditions is not None:
+                index = xml_node.index(alarm_conditions) + 1
+                xml_node.insert(index, self.comments)
+            else:
+                xml_node.insert(0, self.comments)
+            self.record("insert", xml_node, self.comments, xml_node.index(self.comments))
+        return self.comments
+
+    def add_comment(self, diag, texts=None):
+        """Create the Comment of an operand with the given texts per language."""
+        comments = self.ensure_comments()
+        comment = etree.SubElement(comments, "Comment", {"Operand": f".{diag}"})
+        self.operands[diag] = comment
+        self.record("insert", comments, comment, len(comments) - 1)
+        for lan, text in (texts or {}).items():
+            self.add_localized(diag, lan, text)
+        return comment
+
+    def add_localized(self, diag, lan, text):
+        comment = self.operands[diag]
+        loc = etree.SubElement(comment, "LocalizedComment", {"Lang": lan})
+        loc.text = etree.CDATA(text)
+        self.record("insert", comment, loc, len(comment) - 1)
+        return loc
+
+    def set_text(self, diag, lan, text):
+        """Set the text of an operand and language, creating the comment if needed."""
+        if diag not in self.operands:
+            self.add_comment(diag)
+        loc = self.get_localized(diag, lan)
+        if loc is None:
+            return self.add_localized(diag, lan, text)
+        return self.set_localized_text(loc, text)
+
+    def set_localized_text(self, loc, text):
+        """Set the text of a LocalizedComment element of the instance, found with iter_localized.
+
+        The element is replaced by a new one, so the old one is kept as is for undo.
+        """
+        new = etree.Element("LocalizedComment", loc.attrib)
+        new.text = etree.CDATA(text)
+        new.tail = loc.tail
+        parent = loc.getparent()
+        parent.replace(loc, new)
+        self.record("replace", parent, loc, new)
+        return new
+
+    def remove_language(self, diag, lan):
+        """Remove all the texts of a language from the comment of an operand."""
+        comment = self.operands.get(diag)
+        if comment is None:
+            return
+        for loc in comment.findall("LocalizedComment"):
+            if loc.attrib.get("Lang") == lan:
+                position = comment.index(loc)
+                comment.remove(loc)
+                self.record("remove", comment, loc, position)
+
+    def record(self, kind, parent, element, other):
+        self.version += 1
+        if self.journal is not None:
+            self.journal.record((self, kind, parent, element, other))
+
+    def revert(self, change):
+        """Undo a change recorded in the journal."""
+        _, kind, parent, element, other = change
+        if kind == "insert":
+            self.detach(parent, element)
+        elif kind == "remove":
+            self.attach(parent, element, other)
+        else:
+            parent.replace(other, element)
+        self.version += 1
+
+    def reapply(self, change):
+        """Redo a change recorded in the journal."""
+        _, kind, parent, element, other = change
+        if kind == "insert":
+            self.attach(parent, element, other)
+        elif kind == "remove":
+            self.detach(parent, element)
+        else:
+            parent.replace(element, other)
+        self.version += 1
+
+    def attach(self, parent, element, position):
+        parent.insert(position, element)
+        if element.tag == "Comments":
+            self.comments = element
+        elif element.tag == "Comment":
+            self.operands[element.get("Operand").lower()[1:]] = element
+
+    def detach(self, parent, element):
+        parent.remove(element)
+        if element.tag == "Comments":
+            self.comments = None
+        elif element.tag == "Comment":
+            del self.operands[element.get("Operand").lower()[1:]]
+
+class CachedComments:
+    """Read-only stand-in for a CommentIndex, with the texts from the project cache."""
+
+    version = 0
+
+    def __init__(self, texts, count):
+        self._texts = texts
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def texts(self, AOI):
+        return self._texts
+
+    def diagnostics(self):
+        return self._texts.diagnostics()
@@ -0,0 +1,16 @@
+
+VERSION = "0.1.10"
+KEY_LANGUAGE = "en-GB"
+LANGUAGES = [KEY_LANGUAGE, "sv-SE"]
+# Names of the languages in the localization files of Logix Designer
+LANGUAGE_NAMES = {"en-GB": "English (United Kingdom)", "sv-SE": "svenska (Sverige)"}
+DIAGNOSTIC_WORDS = ["idiagnostic1", "idiagnostic2", "idiagnostic3"]
+DIAG_TYPES = ["UF", "UW", "UM", "SF", "SW", "SM"]
+USER_DIAG_TEXTS = [f"{dt}_{i:02d}" for dt in DIAG_TYPES for i in range(64)]
+NOT_ALLOWED_TEXTS = ["DO NOT USE", "ANVÄND EJ"]
+COLOR_WHITE = [255,255,255,255]
+COLOR_RED = [200,0,0,255]
+COLOR_ORANGE = [255,165,0,255]
+COLOR_PURPLE = [128,0,128,255]
+STATUS_OK = "OK"
+STATUS_ISSUE = "ISSUE"
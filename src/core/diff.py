@@ -0,0 +1,142 @@
+"""Diagnostics diff between two revisions of an L5X project.
+
+Both files are read as bytes and every MCP instance tag is hashed, so only
+the tags that differ (or whose AOI changed) are parsed and compared cell by
+cell. Between two deliveries of the same project most tags are unchanged,
+so the cost is close to reading the files.
+"""
+import csv
+import json
+import mmap
+
+from lxml import etree
+
+from core.comments import CommentIndex
+from core.l5x import section, project_tags, content_hash, load_AOIs
+from core.profiling import profiler
+from core.validation import validate_instance, status_from_color
+
+CSV_FIELDS = ["change", "name", "operand", "lang", "old", "new"]
+
+
+class ProjectBytes:
+    """The AOIs and the byte ranges and hashes of the MCP instance tags of an L5X file."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.parser = etree.XMLParser(strip_cdata=False, huge_tree=True)
+        AOIs_range = section(self.data, b"AddOnInstructionDefinitions")
+        self.AOIs = load_AOIs(etree.fromstring(self.data[AOIs_range[0]:AOIs_range[3]], self.parser)) if AOIs_range else {}
+        self.tags = {}    # ins_name -> (datatype, start, end)
+        self.hashes = {}  # ins_name -> content hash of the tag
+        for name, _, datatype, start, end in project_tags(self.data):
+            if datatype in self.AOIs:
+                self.tags[name] = (datatype, start, end)
+                self.hashes[name] = content_hash(self.data[start:end])
+
+    def texts(self, ins_name):
+        """Parse an instance tag and return its InstanceTexts."""
+        datatype, start, end = self.tags[ins_name]
+        AOI = self.AOIs[datatype]
+        return CommentIndex(etree.fromstring(self.data[start:end], self.parser)).texts(AOI)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def compare_AOIs(old, new):
+    """Return the AOI changes and the names of the AOIs whose revision or texts changed."""
+    changes = []
+    changed = set()
+    for name in old.keys() | new.keys():
+        if name not in new:
+            changes.append({"change": "AOI_removed", "name": name, "old": old[name].revision})
+        elif name not in old:
+            changes.append({"change": "AOI_added", "name": name, "new": new[name].revision})
+        elif old[name].revision != new[name].revision or old[name].diagnostics() != new[name].diagnostics():
+            changes.append({"change": "AOI_changed", "name": name, "old": old[name].revision, "new": new[name].revision})
+            changed.add(name)
+    return sorted(changes, key=lambda change: change["name"]), changed
+
+def compare_texts(ins_name, old_texts, new_texts):
+    """Return the added, removed and changed texts of an instance, cell by cell."""
+    old = old_texts.diagnostics()
+    new = new_texts.diagnostics()
+    res = []
+    for diag in sorted(old.keys() | new.keys()):
+        old_row = old.get(diag, {})
+        new_row = new.get(diag, {})
+        for lan in sorted(old_row.keys() | new_row.keys()):
+            old_text = old_row.get(lan, "")
+            new_text = new_row.get(lan, "")
+            if old_text == new_text:
+                continue
+            change = "text_added" if old_text == "" else "text_removed" if new_text == "" else "text_changed"
+            res.append({"change": change, "name": ins_name, "operand": diag, "lang": lan, "old": old_text, "new": new_text})
+    return res
+
+def instance_status(texts):
+    return status_from_color(validate_instance(texts)[1])
+
+def compare_projects(old_path, new_path):
+    """Compare the diagnostics of two revisions of a project.
+
+    Returns a dict with a summary and the list of changes: AOIs added,
+    removed or changed, instances added or removed, texts added, removed or
+    changed, and instances whose status changed.
+    """
+    with profiler.span("diff") as counts:
+        old = ProjectBytes(old_path)
+        try:
+            new = ProjectBytes(new_path)
+            try:
+                changes, changed_AOIs = compare_AOIs(old.AOIs, new.AOIs)
+                texts = []
+                statuses = []
+                compared = 0
+                changes += [{"change": "instance_removed", "name": ins_name, "old": old.tags[ins_name][0]}
+                            for ins_name in old.tags if ins_name not in new.tags]
+                for ins_name in new.tags:
+                    if ins_name not in old.tags:
+                        changes.append({"change": "instance_added", "name": ins_name, "new": new.tags[ins_name][0]})
+                        continue
+                    datatype = new.tags[ins_name][0]
+                    if old.hashes[ins_name] == new.hashes[ins_name] and datatype not in changed_AOIs:
+                        continue
+                    compared += 1
+                    old_texts = old.texts(ins_name)
+                    new_texts = new.texts(ins_name)
+                    texts += compare_texts(ins_name, old_texts, new_texts)
+                    old_status = instance_status(old_texts)
+                    new_status = instance_status(new_texts)
+                    if old_status != new_status:
+                        statuses.append({"change": "status", "name": ins_name, "old": old_status, "new": new_status})
+                changes += texts + statuses
+            finally:
+                new.close()
+        finally:
+            old.close()
+        summary = {
+            "old": old_path,
+            "new": new_path,
+            "old_instances": len(old.tags),
+            "new_instances": len(new.tags),
+            "compared": compared,
+        }
+        for change in changes:
+            summary[change["change"]] = summary.get(change["change"], 0) + 1
+        counts.update(instances=len(new.tags), compared=compared, changes=len(changes))
+    return {"summary": summary, "changes": changes}
+
+def write_diff(diff, report_path):
+    """Write the diff as JSON or CSV, depending on the report file extension."""
+    if report_path.lower().endswith(".csv"):
+        with open(report_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(diff["changes"])
+    else:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(diff, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,102 @@
+import os
+from datetime import datetime
+
+from core.constants import KEY_LANGUAGE, LANGUAGES, LANGUAGE_NAMES, DIAGNOSTIC_WORDS
+from core.comments import comment_text
+from core.files import atomic_open
+from core.l5x import split_operand
+from core.profiling import profiler
+from core.progress import report
+
+# Lines written at once
+WRITE_LINES = 10000
+
+
+def language_column(lan):
+    name = LANGUAGE_NAMES.get(lan)
+    return f"{lan} [{name}]" if name else lan
+
+def export_diagnostics(file_path, instances, progress=None):
+    """Write the current instance diagnostics as a Logix Designer localization file.
+
+    There is one text column per language of LANGUAGES, the KEY column holds
+    the current text in KEY_LANGUAGE.
+    """
+    with profiler.span("export", instances=len(instances)) as counts, atomic_open(file_path, 'w', encoding='utf-8') as f:
+        counts["rows"] = 0
+        # Write header
+        lines = [
+            "#Logix Designer Project Documentation Localization File\n",
+            "#Source: _Filename \n",
+            f"#Date: {datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-5]}\n",
+            "#Version: 1.00\n",
+            "#Options: IncludeProjectContext\n",
+            "#\n",
+            "#** Do not modify the TYPE CONTEXT or KEY columns **\n",
+            "#\n",
+            "\t".join(["TYPE", "CONTEXT", f"KEY:{language_column(KEY_LANGUAGE)}"] + [language_column(lan) for lan in LANGUAGES]) + "\n",
+        ]
+        # Write data
+        count = len(instances)
+        for i, (ins_name, ins_data) in enumerate(instances.items()):
+            if i % 1000 == 0:
+                report(progress, "write", i / count)
+            index = ins_data["comments"]
+            for diag, comment in index.operands.items():
+                if diag.split(".")[0] in DIAGNOSTIC_WORDS:
+                    texts = {lan: comment_text(loc) for lan, loc in index.iter_localized(diag) if lan in LANGUAGES}
+                    if texts:
+                        key = ins_name + comment.attrib.get("Operand").replace("\n", "").upper()
+                        lines.append("\t".join(["TAG", key, texts.get(KEY_LANGUAGE, "")] + [texts.get(lan, "") for lan in LANGUAGES]) + "\n")
+                        counts["rows"] += 1
+            if len(lines) >= WRITE_LINES:
+                f.writelines(lines)
+                lines = []
+        f.writelines(lines)
+
+def import_diagnostics(file_path, instances, progress=None):
+    """Apply the texts of a translated localization file to the instance comments.
+
+    Rows are joined to the instances by their CONTEXT. Rows whose KEY text
+    is not the current KEY_LANGUAGE text any more are skipped as conflicts,
+    and empty cells and languages not in LANGUAGES are ignored.
+    Returns (summary, names of the instances that changed).
+    """
+    summary = {"rows": 0, "applied": 0, "unknown": 0, "conflicts": 0}
+    changed = set()
+    size = os.path.getsize(file_path) or 1
+    read = 0
+    with profiler.span("import") as counts, open(file_path, encoding="utf-8-sig", newline="") as f:
+        languages = None
+        for line in f:
+            read += len(line)
+            if line.startswith("#"):
+                continue
+            cells = line.rstrip("\r\n").split("\t")
+            if cells[0] == "TYPE":
+                languages = [cell.split(" ")[0] for cell in cells[3:]]
+                continue
+            if cells[0] != "TAG" or languages is None or len(cells) < 3:
+                continue
+            summary["rows"] += 1
+            if summary["rows"] % 1000 == 0:
+                report(progress, "import", read / size)
+            # CONTEXT is the qualified tag name followed by the operand
+            ins_name, operand = split_operand(cells[1])
+            ins_data = instances.get(ins_name)
+            diag = operand.lower()
+            if ins_data is None or diag.split(".")[0] not in DIAGNOSTIC_WORDS:
+                summary["unknown"] += 1
+                continue
+            index = ins_data["comments"]
+            if index.get_text(diag, KEY_LANGUAGE) != cells[2]:
+                summary["conflicts"] += 1
+                continue
+            for lan, text in zip(languages, cells[3:]):
+                if lan in LANGUAGES and text != "" and index.get_text(diag, lan, None) != text:
+                    index.set_text(diag, lan, text)
+                    summary["applied"] += 1
+                    changed.add(ins_name)
+        summary["instances"] = len(changed)
+        counts.update(summary)
+    return summary, changed
@@ -0,0 +1,17 @@
+
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(file_path, mode="w", **kwargs):
+    """Open a temporary file next to file_path and move it in place only if the block succeeds."""
+    temp_path = f"{file_path}.tmp"
+    try:
+        with open(temp_path, mode, **kwargs) as f:
+            yield f
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
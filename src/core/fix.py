@@ -0,0 +1,66 @@
+
+from core.constants import LANGUAGES, DIAG_TYPES, NOT_ALLOWED_TEXTS
+from core.comments import comment_text
+from core.profiling import profiler
+
+
+def new_summary():
+    return {"instances": 0, "created": 0, "overwritten": 0, "removed": 0}
+
+def fix_plan(diag_aoi):
+    """Compute once per AOI the expected texts and which languages may be overwritten.
+
+    Returns a list of (diag, texts_aoi, overwrite) where overwrite is the set of
+    languages whose AOI text is not allowed or AOI specific, so the instance
+    text is always replaced with it.
+    """
+    plan = []
+    for diag, texts_aoi in diag_aoi.items():
+        overwrite = {lan for lan, text_aoi in texts_aoi.items() if text_aoi in NOT_ALLOWED_TEXTS or text_aoi[:2] not in DIAG_TYPES}
+        plan.append((diag, texts_aoi, overwrite))
+    return plan
+
+def fix_instance(index, plan, summary):
+    """Copy the AOI diagnostics of a fix plan to the comments of an instance."""
+    for diag, texts_aoi, overwrite in plan:
+        if diag in index:
+            locs = dict(index.iter_localized(diag))
+            # Remove not allowed languages
+            for lan in list(locs):
+                if lan not in LANGUAGES:
+                    index.remove_language(diag, lan)
+                    del locs[lan]
+                    summary["removed"] += 1
+            # Allowed language, check if needs update
+            for lan, text_aoi in texts_aoi.items():
+                loc = locs.get(lan)
+                if loc is None:
+                    # Language missing, create it
+                    index.add_localized(diag, lan, text_aoi)
+                    summary["created"] += 1
+                else:
+                    # Overwrite not allowed diagnostic text only, unless it is the AOI text already
+                    text = comment_text(loc)
+                    if (lan in overwrite or text == "") and text != text_aoi:
+                        index.set_localized_text(loc, text_aoi)
+                        summary["overwritten"] += 1
+        else:
+            # Diag does not exist, create it
+            index.add_comment(diag, texts_aoi)
+            summary["created"] += len(texts_aoi)
+    summary["instances"] += 1
+    return summary
+
+def fix_instances(instances, validation, ins_names):
+    """Fix many instances in one pass, computing the fix plan once per AOI type."""
+    summary = new_summary()
+    with profiler.span("fix_all") as counts:
+        by_type = {}
+        for ins_name in ins_names:
+            by_type.setdefault(instances[ins_name]["datatype"], []).append(ins_name)
+        for datatype, names in by_type.items():
+            plan = fix_plan(validation.get_diag_aoi(datatype))
+            for ins_name in names:
+                fix_instance(instances[ins_name]["comments"], plan, summary)
+        counts.update(AOIs=len(by_type), **summary)
+    return summary
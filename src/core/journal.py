@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+
+# Undo steps kept, the oldest are dropped first
+UNDO_STEPS = 100
+
+
+class Journal:
+    """Undo and redo of the changes to the instance comments.
+
+    CommentIndex records every change as (index, kind, parent, element,
+    other): an element inserted or removed at a position, or a
+    LocalizedComment replaced by a new one. The elements themselves are
+    kept, not copies of the tree, so memory grows with what changed. The
+    changes of one action (an edit, a fix, Fix all, a replace or an import)
+    are grouped in a step, undone and redone together.
+    """
+
+    def __init__(self, limit=UNDO_STEPS):
+        self.limit = limit
+        self.undo_steps = []  # (label, [changes])
+        self.redo_steps = []
+        self.current = None   # Changes of the step being recorded
+        self.names = {}       # CommentIndex -> instance name
+
+    def track(self, ins_name, index):
+        """Record the changes of the comments of an instance."""
+        index.journal = self
+        self.names[index] = ins_name
+
+    @contextmanager
+    def step(self, label):
+        """Record the changes made in the block as one undo step.
+
+        If the block raises, like a cancelled import, its changes are
+        reverted and no step is recorded.
+        """
+        if self.current is not None:
+            # Part of the step already being recorded
+            yield
+            return
+        self.current = []
+        try:
+            yield
+        except BaseException:
+            changes, self.current = self.current, None
+            for change in reversed(changes):
+                change[0].revert(change)
+            raise
+        changes, self.current = self.current, None
+        self.add_step(label, changes)
+
+    def add_step(self, label, changes):
+        if not changes:
+            return
+        self.undo_steps.append((label, changes))
+        del self.undo_steps[:-self.limit]
+        self.redo_steps = []
+
+    def record(self, change):
+        if self.current is None:
+            self.add_step("Change", [change])
+        else:
+            self.current.append(change)
+
+    def can_undo(self):
+        return bool(self.undo_steps) and self.current is None
+
+    def can_redo(self):
+        return bool(self.redo_steps) and self.current is None
+
+    def undo(self):
+        """Undo the last step, returns (label, names of the changed instances) or None."""
+        if not self.can_undo():
+            return None
+        label, changes = self.undo_steps.pop()
+        for change in reversed(changes):
+            change[0].revert(change)
+        self.redo_steps.append((label, changes))
+        return label, self.changed_instances(changes)
+
+    def redo(self):
+        """Redo the last undone step, returns (label, names of the changed instances) or None."""
+        if not self.can_redo():
+            return None
+        label, changes = self.redo_steps.pop()
+        for change in changes:
+            change[0].reapply(change)
+        self.undo_steps.append((label, changes))
+        return label, self.changed_instances(changes)
+
+    def changed_instances(self, changes):
+        return {self.names[change[0]] for change in changes}
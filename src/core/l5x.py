@@ -0,0 +1,544 @@
+import hashlib
+import mmap
+import os
+import re
+import time
+
+from lxml import etree
+
+from core.constants import DIAGNOSTIC_WORDS, LANGUAGES
+from core.comments import CommentIndex, CachedComments
+from core.memory import PeakMemory
+from core.model import StringTable, AOITexts, used_texts
+from core.files import atomic_open
+from core.profiling import profiler
+from core.progress import report, ProgressReader, ProgressWriter
+
+# Elements that contain the controller and program tags, kept while streaming
+STREAM_CONTAINERS = ("RSLogix5000Content", "Controller", "Tags", "Programs", "Program")
+# Start of a Tag element with its name. Controller tags come before the
+# program tags, the tags of a program come first in it, and AOI
+# definitions only have LocalTag elements.
+TAG_START = re.compile(rb'<Tag\s[^>]*?\bName="([^"]*)"')
+COPY_CHUNK = 4 * 1024 * 1024
+TAG_ATTRIBUTES = re.compile(rb'\s(Name|DataType)="([^"]*)"')
+ELEMENT_NAME = re.compile(rb'[^\s/>]+')
+PROGRAM_PREFIX = "Program:"
+# Share of the texts still used below which a rescan parses all the tags again with a new StringTable
+USED_TEXTS = 0.5
+
+
+def parse_file(file_path, progress=None):
+    """Parse an L5X file keeping CDATA sections, so the tree can be written back as is."""
+    parser = etree.XMLParser(strip_cdata=False)
+    if progress is None:
+        return etree.parse(file_path, parser)
+    with open(file_path, "rb") as f:
+        return etree.parse(ProgressReader(f, progress, "parse"), parser)
+
+def parse_AOI(elem, strings):
+    """Return the diagnostic texts of an MCP AOI definition, or None if it is not an MCP AOI."""
+    AOI_name = elem.attrib.get("Name")
+    for param in elem.find("Parameters"):
+        if param.attrib.get("Name") == "cDeviceID" and AOI_name != "MCP_Device":
+            break
+    else:
+        return None
+    res = {}
+    for param in elem.find("Parameters"):
+        AOI_diag_word = param.attrib.get("Name")
+        if AOI_diag_word.lower() in DIAGNOSTIC_WORDS:
+            for comment in param.find("Comments"):
+                operand = comment.attrib.get("Operand")
+                texts = {lan: "" for lan in LANGUAGES}
+                for loc_comm in comment.findall("LocalizedComment"):
+                    lan = loc_comm.attrib.get("Lang")
+                    text = loc_comm.text.replace("\n", "")
+                    texts[lan] = text
+                res[f"{AOI_diag_word.lower()}{operand}"] = texts
+    return AOITexts(AOI_name, elem.attrib.get("Revision"), res, strings)
+
+def load_AOIs(xml_root, parse=parse_AOI):
+    """Return the MCP AOI definitions with their diagnostic texts per operand and language.
+
+    parse reads one definition, like parse_AOI or LibraryReader.parse.
+    """
+    res = {}
+    strings = StringTable()  # Texts shared by all the AOIs and their instances
+    for elem in xml_root.iter("AddOnInstructionDefinition"):
+        AOI = parse(elem, strings)
+        if AOI is not None:
+            res[elem.attrib.get("Name")] = AOI
+    return res
+
+def qualified_name(name, scope=None):
+    """Return the name of a tag as seen from outside its scope, like Program:MainProgram.Motor1 for a program tag."""
+    return name if scope is None else f"{PROGRAM_PREFIX}{scope}.{name}"
+
+def split_name(ins_name):
+    """Return (scope, tag name) of a qualified tag name, the scope being None for a controller tag."""
+    if ins_name.startswith(PROGRAM_PREFIX):
+        scope, _, name = ins_name[len(PROGRAM_PREFIX):].partition(".")
+        return scope, name
+    return None, ins_name
+
+def split_operand(operand):
+    """Split an operand like Motor1.iDiagnostic2.5 or Program:MainProgram.Motor1.iDiagnostic2.5 into (qualified tag name, member)."""
+    start = operand.find(".") + 1 if operand.startswith(PROGRAM_PREFIX) else 0
+    end = operand.find(".", start)
+    if end < 0:
+        return operand, ""
+    return operand[:end], operand[end + 1:]
+
+def tag_scopes(controller):
+    """Yield (scope, Tags element) of the controller and of every program, the scope being None for the controller."""
+    tags = controller.find("Tags")
+    if tags is not None:
+        yield None, tags
+    programs = controller.find("Programs")
+    if programs is not None:
+        for program in programs.iterchildren("Program"):
+            tags = program.find("Tags")
+            if tags is not None:
+                yield program.attrib.get("Name"), tags
+
+def load_instances(xml_root, AOIs, progress=None):
+    """Return the controller and program tags whose data type is one of the loaded MCP AOIs, by qualified name.
+
+    Only the Tags elements of the controller and of the programs are read,
+    each tag once.
+    """
+    res = {}
+    scopes = list(tag_scopes(xml_root.find("Controller")))
+    count = sum(len(tags) for _, tags in scopes) or 1
+    i = 0
+    for scope, tags in scopes:
+        for tag in tags:
+            if i % 1000 == 0:
+                report(progress, "instances", i / count)
+            i += 1
+            if tag.attrib.get("DataType") in AOIs:
+                res[qualified_name(tag.attrib.get("Name"), scope)] = {
+                    "datatype": tag.attrib.get("DataType"),
+                    "scope": scope,
+                    "XML_node": tag,
+                    "comments": CommentIndex(tag, AOIs[tag.attrib.get("DataType")]),
+                    "tree_node": 0,
+                }
+    return res
+
+def stream_project(file_path, progress=None, parse=parse_AOI):
+    """Load AOIs and instances with iterparse, without keeping the full DOM in memory.
+
+    Only the MCP instance tags are kept, together with their Controller/Tags
+    or Programs/Program/Tags ancestors. Every other element is cleared and removed as soon as it has
+    been read. AOI definitions must come before the tags, as in every L5X
+    exported by Studio5000.
+    """
+    AOIs = {}
+    instances = {}
+    if progress is None:
+        return _stream(file_path, AOIs, instances, parse)
+    with open(file_path, "rb") as f:
+        return _stream(ProgressReader(f, progress, "parse"), AOIs, instances, parse)
+
+def _stream(source, AOIs, instances, parse):
+    keep = None  # AOI definition or MCP instance tag being read
+    strings = StringTable()
+    context = etree.iterparse(source, events=("start", "end"), strip_cdata=False, huge_tree=True)
+    for event, elem in context:
+        if event == "start":
+            if keep is None:
+                if elem.tag == "AddOnInstructionDefinition":
+                    keep = elem
+                elif elem.tag == "Tag" and elem.attrib.get("DataType") in AOIs:
+                    scope = elem.getparent().getparent()
+                    if scope is not None and scope.tag in ("Controller", "Program"):
+                        keep = elem
+            continue
+        if keep is not None:
+            if elem is not keep:
+                continue
+            keep = None
+            if elem.tag == "Tag":
+                scope = elem.getparent().getparent()
+                scope = scope.attrib.get("Name") if scope.tag == "Program" else None
+                instances[qualified_name(elem.attrib.get("Name"), scope)] = {
+                    "datatype": elem.attrib.get("DataType"),
+                    "scope": scope,
+                    "XML_node": elem,
+                    "comments": CommentIndex(elem, AOIs[elem.attrib.get("DataType")]),
+                    "tree_node": 0,
+                }
+                continue
+            AOI = parse(elem, strings)
+            if AOI is not None:
+                AOIs[elem.attrib.get("Name")] = AOI
+        elif elem.tag in STREAM_CONTAINERS:
+            continue
+        # Free everything else as it goes
+        parent = elem.getparent()
+        elem.clear()
+        if parent is not None:
+            parent.remove(elem)
+    return AOIs, instances
+
+def load_project(file_path, streaming=False, progress=None, library=None):
+    """Load an L5X file and return (tree, AOIs, instances, stats).
+
+    In streaming mode the tree is None, since only the MCP instance tags are
+    kept. With an AOILibrary the AOI definitions already in it are not
+    parsed again, and stats["library"] tells which differ from it.
+    """
+    start = time.perf_counter()
+    memory = PeakMemory()
+    reader = library.reader() if library is not None else None
+    parse = reader.parse if reader is not None else parse_AOI
+    if streaming:
+        tree = None
+        with profiler.span("stream", bytes=os.path.getsize(file_path)) as counts:
+            AOIs, instances = stream_project(file_path, progress, parse)
+            counts.update(AOIs=len(AOIs), instances=len(instances), comments=count_comments(instances))
+    else:
+        with profiler.span("parse", bytes=os.path.getsize(file_path)):
+            tree = parse_file(file_path, progress)
+        xml_root = tree.getroot()
+        report(progress, "AOIs")
+        with profiler.span("load_AOIs") as counts:
+            AOIs = load_AOIs(xml_root, parse)
+            counts["AOIs"] = len(AOIs)
+        with profiler.span("load_instances") as counts:
+            instances = load_instances(xml_root, AOIs, progress)
+            counts.update(instances=len(instances), comments=count_comments(instances))
+    stats = {
+        "mode": "streaming" if streaming else "dom",
+        "load_time": time.perf_counter() - start,
+        "peak_memory": memory.peak(),
+    }
+    if reader is not None:
+        stats["library"] = reader.save()
+    return tree, AOIs, instances, stats
+
+def write_file(tree, file_path, progress=None, expected_size=None):
+    """Write the tree to an L5X file, replacing it only once it is completely written."""
+    with profiler.span("save") as counts:
+        with atomic_open(file_path, "wb") as f:
+            if progress is not None:
+                f = ProgressWriter(f, progress, "write", expected_size)
+            tree.write(f, encoding="utf-8", xml_declaration=True)
+        counts["bytes"] = os.path.getsize(file_path)
+
+class SavedFile:
+    """The L5X file a project was last loaded from or saved to, with the comment versions of its instances.
+
+    The instances whose comments changed since then are the tags to write
+    again on the next save.
+    """
+
+    def __init__(self, file_path, versions):
+        self.file_path = file_path
+        self.versions = versions
+        stat = os.stat(file_path)
+        self.stat = (stat.st_size, stat.st_mtime)
+
+    def unchanged(self):
+        """Tell if the file on disk is still the one that was loaded or saved."""
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime) == self.stat
+
+    def changed(self, instances):
+        """Return the names of the instances changed since, in file order."""
+        return [ins_name for ins_name, ins_data in instances.items() if ins_data["comments"].version != self.versions.get(ins_name)]
+
+def instance_versions(instances):
+    return {ins_name: ins_data["comments"].version for ins_name, ins_data in instances.items()}
+
+def tag_bytes(xml_node):
+    """Serialize an instance tag on its own, to be spliced into the file."""
+    return etree.tostring(xml_node, encoding="utf-8", xml_declaration=False, with_tail=False)
+
+def find_tags(data, names):
+    """Return {name: (start, end)} byte ranges of the tags with the given qualified names."""
+    res = {}
+    scopes = {}  # scope -> tag names
+    for ins_name in names:
+        scope, name = split_name(ins_name)
+        scopes.setdefault(scope, set()).add(name)
+    for scope, scope_names in scopes.items():
+        pos = 0
+        if scope is not None:
+            program = re.compile(rb'<Program\s[^>]*?\bName="' + re.escape(scope.encode("utf-8")) + rb'"').search(data)
+            if program is None:
+                continue
+            pos = program.end()
+        found = set()
+        for match in TAG_START.finditer(data, pos):
+            name = match.group(1).decode("utf-8")
+            if name in scope_names and name not in found:
+                found.add(name)
+                res[qualified_name(name, scope)] = (match.start(), tag_end(data, match.start()))
+                if len(found) == len(scope_names):
+                    break
+    missing = [name for name in names if name not in res]
+    if missing:
+        raise ValueError(f"tags not found in the file: {', '.join(missing[:10])}")
+    return res
+
+def tag_end(data, start):
+    """Return the offset after the end of the Tag element starting at start, skipping CDATA sections."""
+    pos = data.find(b">", start)
+    if data[pos - 1:pos] == b"/":
+        return pos + 1
+    end = data.find(b"</Tag>", pos)
+    while True:
+        if end < 0:
+            raise ValueError(f"unclosed tag at byte {start}")
+        cdata = data.find(b"<![CDATA[", pos, end)
+        if cdata < 0:
+            return end + len(b"</Tag>")
+        pos = data.find(b"]]>", cdata)
+        if pos < 0:
+            raise ValueError(f"unclosed CDATA section at byte {cdata}")
+        pos += len(b"]]>")
+        if pos > end:
+            # The end tag was part of the CDATA text
+            end = data.find(b"</Tag>", pos)
+
+def splice_file(source_path, tags, file_path, progress=None):
+    """Write source_path to file_path with the given tags replaced.
+
+    tags is a list of (name, bytes) of controller tags. Everything else is
+    copied byte for byte, so the file keeps its formatting and saving a few
+    changed tags costs about as much as a file copy.
+    """
+    with profiler.span("save", tags=len(tags)) as counts:
+        new_tags = dict(tags)
+        # The source is closed before the new file replaces it, for saving over it
+        with atomic_open(file_path, "wb") as f, open(source_path, "rb") as source:
+            if progress is not None:
+                f = ProgressWriter(f, progress, "write", os.fstat(source.fileno()).st_size)
+            data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                ranges = find_tags(data, new_tags)
+                pos = 0
+                for name, (start, end) in sorted(ranges.items(), key=lambda item: item[1]):
+                    copy_bytes(data, pos, start, f)
+                    tag = new_tags[name]
+                    if data.find(b"\r\n", start, end) >= 0:
+                        # Keep the line endings of the file
+                        tag = tag.replace(b"\n", b"\r\n")
+                    f.write(tag)
+                    pos = end
+                copy_bytes(data, pos, len(data), f)
+            finally:
+                data.close()
+        counts["bytes"] = os.path.getsize(file_path)
+
+def copy_bytes(data, start, end, f):
+    for pos in range(start, end, COPY_CHUNK):
+        f.write(data[pos:min(pos + COPY_CHUNK, end)])
+
+def find_outside_cdata(data, sub, pos=0, end=None):
+    """Return the offset of sub in data from pos, skipping CDATA sections, or -1."""
+    end = len(data) if end is None else end
+    found = data.find(sub, pos, end)
+    while found >= 0:
+        cdata = data.find(b"<![CDATA[", pos, found)
+        if cdata < 0:
+            return found
+        pos = data.find(b"]]>", cdata)
+        if pos < 0:
+            return -1
+        pos += len(b"]]>")
+        if pos > found:
+            # It was in the CDATA text
+            found = data.find(sub, pos, end)
+    return -1
+
+def element_start(data, name):
+    """Return the (start, content start) byte offsets of the first element with the given name, or None.
+
+    For an empty element like <Tags/> content start is the offset after it.
+    """
+    pos = 0
+    while True:
+        start = find_outside_cdata(data, b"<" + name, pos)
+        if start < 0:
+            return None
+        pos = start + len(name) + 1
+        if data[pos:pos + 1] in (b">", b"/", b" ", b"\t", b"\r", b"\n"):
+            return start, data.find(b">", pos) + 1
+
+def element_end(data, name, content):
+    """Return the offset after the closing tag of an element, from its content start."""
+    if data[content - 2:content] == b"/>":
+        return content
+    close = b"</" + name + b">"
+    end = find_outside_cdata(data, close, content)
+    if end < 0:
+        raise ValueError(f"unclosed {name.decode()} element")
+    return end + len(close)
+
+def section(data, name):
+    """Return the (start, content start, content end, end) byte offsets of the first element with the given name, or None."""
+    element = element_start(data, name)
+    if element is None:
+        return None
+    start, content = element
+    end = element_end(data, name, content)
+    if end == content:
+        return start, content, content, content
+    return start, content, end - len(name) - 3, end
+
+def next_element(data, pos):
+    """Return (name, start, content start) of the next child element from pos.
+
+    At the closing tag of the parent name is None and content start is the
+    offset after the closing tag.
+    """
+    while True:
+        start = data.find(b"<", pos)
+        if start < 0:
+            raise ValueError(f"unclosed element before byte {pos}")
+        if data[start + 1:start + 4] != b"!--":
+            break
+        pos = data.find(b"-->", start)
+        if pos < 0:
+            raise ValueError(f"unclosed comment at byte {start}")
+        pos += len(b"-->")
+    content = data.find(b">", start) + 1
+    if data[start + 1:start + 2] == b"/":
+        return None, start, content
+    return ELEMENT_NAME.match(data, start + 1).group(), start, content
+
+def project_tags(data):
+    """Yield (qualified name, scope, data type, start, end) of the controller and program tags, from the bytes of an L5X file.
+
+    The Controller element is read in one pass: its Tags and the Tags of
+    every program are read tag by tag, and the other elements are skipped,
+    each CDATA section once.
+    """
+    controller = element_start(data, b"Controller")
+    if controller is None or data[controller[1] - 2:controller[1]] == b"/>":
+        return
+    pos = controller[1]
+    while True:
+        name, start, pos = next_element(data, pos)
+        if name is None:
+            return
+        if name == b"Tags":
+            pos = yield from scope_tags(data, pos, None)
+        elif name == b"Programs" and data[pos - 2:pos] != b"/>":
+            while True:
+                name, start, pos = next_element(data, pos)
+                if name is None:
+                    break
+                if name != b"Program" or data[pos - 2:pos] == b"/>":
+                    pos = element_end(data, name, pos)
+                    continue
+                scope = dict(TAG_ATTRIBUTES.findall(data, start, pos))[b"Name"].decode("utf-8")
+                while True:
+                    name, start, pos = next_element(data, pos)
+                    if name is None:
+                        break
+                    if name == b"Tags":
+                        pos = yield from scope_tags(data, pos, scope)
+                    else:
+                        pos = element_end(data, name, pos)
+        else:
+            pos = element_end(data, name, pos)
+
+def scope_tags(data, pos, scope):
+    """Yield the tags of a Tags element from its content start, return the offset after it."""
+    if data[pos - 2:pos] == b"/>":
+        return pos
+    while True:
+        name, start, content = next_element(data, pos)
+        if name is None:
+            return content
+        pos = element_end(data, name, content)
+        if name == b"Tag":
+            attributes = dict(TAG_ATTRIBUTES.findall(data, start, content))
+            tag_name = qualified_name(attributes[b"Name"].decode("utf-8"), scope)
+            yield tag_name, scope, attributes.get(b"DataType", b"").decode("utf-8"), start, pos
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def scan_project(file_path, previous=None, keep_xml=True, parse=parse_AOI):
+    """Load the AOIs and the MCP instances of an L5X file, parsing only their elements.
+
+    The file is read as bytes, and only the AOI definitions and the MCP
+    instance tags are parsed, each on its own. Returns (AOIs, instances,
+    hashes) where hashes has the content hash of the AOI definitions and of
+    every instance tag. With the result of a previous scan of the file, the
+    instances whose tag did not change are reused as they are, and
+    everything is parsed again only if the AOI definitions changed, or
+    if less than USED_TEXTS of the StringTable they share is still used,
+    since the texts of the reparsed tags are added to it. Without keep_xml the instances only keep their texts, read-only, like
+    the projects loaded from the cache. parse reads one AOI definition, as
+    in load_AOIs.
+    """
+    parser = etree.XMLParser(strip_cdata=False, huge_tree=True)
+    with profiler.span("scan") as counts, open(file_path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            AOIs_range = section(data, b"AddOnInstructionDefinitions")
+            AOIs_hash = content_hash(data[AOIs_range[0]:AOIs_range[3]]) if AOIs_range else b""
+            if previous is not None and previous[2]["AOIs"] == AOIs_hash and not stale_texts(previous[0], previous[1]):
+                old_AOIs, old_instances, old_hashes = previous
+            else:
+                old_AOIs, old_instances, old_hashes = {}, {}, {}
+            AOIs = old_AOIs
+            if AOIs_range and not AOIs:
+                AOIs = load_AOIs(etree.fromstring(data[AOIs_range[0]:AOIs_range[3]], parser), parse)
+            instances = {}
+            hashes = {"AOIs": AOIs_hash}
+            parsed = 0
+            for name, scope, datatype, start, end in project_tags(data):
+                if datatype not in AOIs:
+                    continue
+                hashes[name] = content_hash(data[start:end])
+                if old_hashes.get(name) == hashes[name]:
+                    instances[name] = old_instances[name]
+                    continue
+                tag = etree.fromstring(data[start:end], parser)
+                index = CommentIndex(tag, AOIs[datatype])
+                if not keep_xml:
+                    tag = None
+                    index = CachedComments(index.texts(AOIs[datatype]), len(index))
+                instances[name] = {
+                    "datatype": datatype,
+                    "scope": scope,
+                    "XML_node": tag,
+                    "comments": index,
+                    "tree_node": 0,
+                }
+                parsed += 1
+        finally:
+            data.close()
+        counts.update(AOIs=len(AOIs), instances=len(instances), parsed=parsed)
+    return AOIs, instances, hashes
+
+def stale_texts(AOIs, instances):
+    """Tell if too few of the texts shared by the AOIs and instances of a scan are still used."""
+    if not AOIs:
+        return False
+    strings = next(iter(AOIs.values())).strings
+    used = used_texts(AOIs, (ins_data["comments"].texts(AOIs[ins_data["datatype"]]) for ins_data in instances.values()))
+    return used < USED_TEXTS * len(strings)
+
+def count_comments(instances):
+    """Return the number of diagnostic comments of the instances."""
+    return sum(len(ins_data["comments"]) for ins_data in instances.values())
+
+def get_instance_diagnostics(xml_node):
+    """Return the diagnostic texts stored in the comments of an instance tag."""
+    return CommentIndex(xml_node).diagnostics()
+
+def get_aoi_diagnostics(AOIs, AOI_name):
+    """Return the diagnostic texts of an AOI as {diag: {lan: text}}."""
+    return AOIs[AOI_name].diagnostics()
@@ -0,0 +1,126 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+
+from lxml import etree
+
+from core.cache import default_cache_dir
+from core.l5x import parse_AOI, content_hash
+from core.model import AOITexts
+from core.profiling import profiler
+
+FORMAT = 1  # Increased when the layout of the stored tables changes
+
+
+def AOI_fingerprint(elem):
+    """Hash of the whole AOI definition, to tell two copies of the same revision apart."""
+    return content_hash(etree.tostring(elem, with_tail=False))
+
+class AOILibrary:
+    """Parsed MCP AOI definitions by (name, Revision), shared by every loaded project.
+
+    Plants use the same AOIs at a few revisions, so the diagnostic table of
+    an AOI is parsed once and stored with the fingerprint of its definition.
+    Later loads of any project take the table from the library when the
+    fingerprint matches. A definition that differs from the library copy of
+    the same revision is parsed as usual and reported as a conflict; the
+    library keeps the first copy it saw. Non-MCP AOIs are stored without a
+    table, so they are not parsed again either.
+    """
+
+    def __init__(self, library_dir=None):
+        self.library_dir = library_dir or default_cache_dir()
+        os.makedirs(self.library_dir, exist_ok=True)
+        self.db_path = os.path.join(self.library_dir, "AOIs.sqlite")
+        self.entries = None  # (name, revision) -> [fingerprint, compressed table, table], read on first use
+        with self.connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS AOIs (
+                name TEXT, revision TEXT, format INTEGER, fingerprint BLOB, data BLOB, added REAL,
+                PRIMARY KEY (name, revision, format))""")
+
+    @contextmanager
+    def connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def read(self):
+        if self.entries is None:
+            with self.connect() as db:
+                rows = db.execute("SELECT name, revision, fingerprint, data FROM AOIs WHERE format = ?", (FORMAT,)).fetchall()
+            self.entries = {(name, revision): [fingerprint, data, None] for name, revision, fingerprint, data in rows}
+        return self.entries
+
+    def reader(self):
+        """Return a LibraryReader for the AOIs of one project."""
+        return LibraryReader(self, self.read())
+
+    def table(self, key):
+        entry = self.entries[key]
+        if entry[2] is None and entry[1] is not None:
+            entry[2] = json.loads(zlib.decompress(entry[1]))
+        return entry[2]
+
+    def add(self, new):
+        """Store the new AOIs read by a LibraryReader, {(name, revision): (fingerprint, AOITexts or None)}."""
+        if not new:
+            return
+        rows = []
+        for (name, revision), (fingerprint, AOI) in new.items():
+            data = None if AOI is None else zlib.compress(json.dumps(AOI.to_table(), ensure_ascii=False).encode("utf-8"), 6)
+            rows.append((name, revision, FORMAT, fingerprint, data, time.time()))
+            self.entries.setdefault((name, revision), [fingerprint, data, None])
+        with self.connect() as db:
+            db.executemany("INSERT OR IGNORE INTO AOIs VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def __len__(self):
+        return len(self.read())
+
+    def clear(self):
+        with self.connect() as db:
+            db.execute("DELETE FROM AOIs")
+        with self.connect() as db:
+            db.execute("VACUUM")
+        self.entries = None
+
+class LibraryReader:
+    """Reads the AOI definitions of one project through the library, collecting the conflicts."""
+
+    def __init__(self, library, entries):
+        self.library = library
+        self.entries = entries
+        self.new = {}        # (name, revision) -> (fingerprint, AOITexts or None) not in the library
+        self.conflicts = []  # (name, revision) whose definition differs from the library copy
+        self.reused = 0
+
+    def parse(self, elem, strings):
+        """Return the diagnostic texts of an AOI definition like parse_AOI, from the library if it has the same definition."""
+        key = (elem.attrib.get("Name"), elem.attrib.get("Revision", ""))
+        fingerprint = AOI_fingerprint(elem)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            self.reused += 1
+            table = self.library.table(key)
+            return None if table is None else AOITexts.from_table(key[0], table, strings)
+        AOI = parse_AOI(elem, strings)
+        if entry is None:
+            self.new[key] = (fingerprint, AOI)
+        elif key not in self.conflicts:
+            self.conflicts.append(key)
+        return AOI
+
+    def save(self):
+        """Store the AOIs seen for the first time and return the load counts."""
+        with profiler.span("library", reused=self.reused, added=len(self.new), conflicts=len(self.conflicts)):
+            self.library.add(self.new)
+        return {
+            "reused": self.reused,
+            "added": len(self.new),
+            "conflicts": [{"AOI": name, "revision": revision} for name, revision in self.conflicts],
+        }
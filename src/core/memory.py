@@ -0,0 +1,91 @@
+
+import os
+import sys
+
+
+def _windows_memory_counters():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+def peak_memory():
+    """Return the peak resident memory of the process in bytes, or None if unknown."""
+    if sys.platform == "win32":
+        counters = _windows_memory_counters()
+        return counters.PeakWorkingSetSize if counters is not None else None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def reset_peak_memory():
+    """Restart the peak resident memory of the process from its current memory.
+
+    Only Linux supports it (through /proc/self/clear_refs); returns False
+    elsewhere, where the peak is the largest memory use since the process started.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+class PeakMemory:
+    """Peak resident memory of a part of the program, like a load or a benchmark phase.
+
+    Without reset_peak_memory, the peak of the part is only known when it
+    went above the previous peak of the process, otherwise it is None.
+    """
+
+    def __init__(self):
+        self.reset = reset_peak_memory()
+        self.before = peak_memory()
+
+    def peak(self):
+        peak = peak_memory()
+        if self.reset or peak is None or self.before is None or peak > self.before:
+            return peak
+        return None
+
+def current_memory():
+    """Return the current resident memory of the process in bytes, or None if unknown."""
+    if sys.platform == "win32":
+        counters = _windows_memory_counters()
+        return counters.WorkingSetSize if counters is not None else None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def format_size(size):
+    if size is None:
+        return "n/a"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+        size /= 1024
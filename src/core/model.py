@@ -0,0 +1,225 @@
+"""Compact in-memory model of the diagnostic texts.
+
+Every text is stored once in a StringTable and referenced by its index. The
+texts of an AOI are an array of (diagnostic, language) cells, and the texts
+of an instance are stored only where they differ from those of its AOI.
+"""
+from array import array
+
+from core.constants import LANGUAGES
+
+ABSENT = -1  # Cell without text in the AOI
+
+
+class StringTable:
+    """Texts of a project, each stored once. Index 0 is the empty text."""
+
+    __slots__ = ("texts", "ids")
+
+    def __init__(self):
+        self.texts = [""]
+        self.ids = {"": 0}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, text):
+        text_id = self.ids.get(text)
+        if text_id is None:
+            text_id = self.ids[text] = len(self.texts)
+            self.texts.append(text)
+        return text_id
+
+class AOITexts:
+    """Diagnostic texts of an MCP AOI definition, as an array of (diag, language) cells.
+
+    Rows are the diagnostics in definition order, columns the LANGUAGES
+    followed by any other language found in the definition.
+    """
+
+    __slots__ = ("name", "revision", "strings", "diags", "languages", "rows", "columns", "cells", "filled")
+
+    def __init__(self, name, revision, diagnostics, strings):
+        languages = list(LANGUAGES)
+        for texts in diagnostics.values():
+            languages += [lan for lan in texts if lan not in languages]
+        self.name = name
+        self.revision = revision
+        self.strings = strings
+        self.diags = tuple(diagnostics)
+        self.languages = tuple(languages)
+        self.rows = {diag: row for row, diag in enumerate(self.diags)}
+        self.columns = {lan: col for col, lan in enumerate(self.languages)}
+        self.cells = array("i", [ABSENT]) * (len(self.diags) * len(self.languages))
+        filled = []  # Cells with a non empty text
+        for diag, texts in diagnostics.items():
+            base = self.rows[diag] * len(self.languages)
+            for lan, text in texts.items():
+                cell = base + self.columns[lan]
+                self.cells[cell] = strings.add(text)
+                if text != "":
+                    filled.append(cell)
+        self.filled = frozenset(filled)
+
+    @classmethod
+    def from_dict(cls, name, AOI, strings):
+        """Build it from {"Revision": revision, diag: {lan: text}}, as stored in the project cache."""
+        return cls(name, AOI["Revision"], {diag: texts for diag, texts in AOI.items() if diag != "Revision"}, strings)
+
+    def to_dict(self):
+        return {"Revision": self.revision, **self.diagnostics()}
+
+    @classmethod
+    def from_table(cls, name, table, strings):
+        """Build it from its cells as returned by to_table, without going through the diagnostics."""
+        self = cls.__new__(cls)
+        self.name = name
+        self.revision = table["Revision"]
+        self.strings = strings
+        self.diags = tuple(table["diags"])
+        self.languages = tuple(table["languages"])
+        self.rows = {diag: row for row, diag in enumerate(self.diags)}
+        self.columns = {lan: col for col, lan in enumerate(self.languages)}
+        add = strings.add
+        self.cells = array("i", [ABSENT if text is None else add(text) for text in table["texts"]])
+        self.filled = frozenset(cell for cell, text in enumerate(table["texts"]) if text)
+        return self
+
+    def to_table(self):
+        """Return the revision, rows, columns and the text of every cell (None without text), as stored in the AOI library."""
+        texts = self.strings.texts
+        return {
+            "Revision": self.revision,
+            "diags": list(self.diags),
+            "languages": list(self.languages),
+            "texts": [None if text_id == ABSENT else texts[text_id] for text_id in self.cells],
+        }
+
+    def cell(self, diag, lan):
+        row = self.rows.get(diag)
+        col = self.columns.get(lan)
+        if row is None or col is None:
+            return None
+        return row * len(self.languages) + col
+
+    def get_text(self, diag, lan, default=""):
+        cell = self.cell(diag, lan)
+        if cell is None or self.cells[cell] == ABSENT:
+            return default
+        return self.strings.texts[self.cells[cell]]
+
+    def row_languages(self, row):
+        """Return (cell, lan, text id) of the languages the AOI has for a diagnostic row."""
+        base = row * len(self.languages)
+        res = []
+        for col, lan in enumerate(self.languages):
+            text_id = self.cells[base + col]
+            if text_id != ABSENT:
+                res.append((base + col, lan, text_id))
+        return res
+
+    def diagnostics(self):
+        """Return {diag: {lan: text}}, like the comments of the definition."""
+        texts = self.strings.texts
+        return {diag: {lan: texts[text_id] for _, lan, text_id in self.row_languages(row)} for row, diag in enumerate(self.diags)}
+
+class InstanceTexts:
+    """Diagnostic texts of an instance, stored only where they differ from its AOI.
+
+    A missing comment or language is the same as an empty text. Languages of
+    an instance comment that the AOI does not have for that diagnostic are
+    kept apart in extra. Diagnostics the AOI does not have are not stored.
+    """
+
+    __slots__ = ("AOI", "diffs", "extra")
+
+    def __init__(self, AOI, diffs=None, extra=None):
+        self.AOI = AOI
+        self.diffs = diffs or {}  # cell -> text id
+        self.extra = extra or {}  # diag -> {lan: text id}
+
+    @classmethod
+    def from_texts(cls, AOI, texts):
+        """Build it from (diag, lan, text) items, the first text of a cell wins."""
+        strings = AOI.strings
+        cells = AOI.cells
+        seen = set()
+        diffs = {}
+        extra = {}
+        for diag, lan, text in texts:
+            cell = AOI.cell(diag, lan)
+            if cell is None or cells[cell] == ABSENT:
+                if diag in AOI.rows:
+                    extra.setdefault(diag, {}).setdefault(lan, strings.add(text))
+                continue
+            if cell in seen:
+                continue
+            seen.add(cell)
+            text_id = strings.add(text)
+            if text_id != cells[cell]:
+                diffs[cell] = text_id
+        # AOI texts the instance does not have at all
+        for cell in AOI.filled.difference(seen):
+            diffs[cell] = 0
+        return cls(AOI, diffs, extra)
+
+    @classmethod
+    def from_dict(cls, AOI, data):
+        """Build it from {"diffs": [[diag, lan, text]], "extra": [[diag, lan, text]]}, as stored in the project cache."""
+        texts = cls(AOI)
+        for diag, lan, text in data["diffs"]:
+            texts.diffs[AOI.cell(diag, lan)] = AOI.strings.add(text)
+        for diag, lan, text in data["extra"]:
+            texts.extra.setdefault(diag, {})[lan] = AOI.strings.add(text)
+        return texts
+
+    def get_text(self, diag, lan):
+        """Return the text of a diagnostic and language, empty if the instance does not have it."""
+        AOI = self.AOI
+        cell = AOI.cell(diag, lan)
+        if cell is None or AOI.cells[cell] == ABSENT:
+            text_id = self.extra.get(diag, {}).get(lan, 0)
+        else:
+            text_id = self.diffs.get(cell, AOI.cells[cell])
+        return AOI.strings.texts[text_id]
+
+    def to_dict(self):
+        AOI = self.AOI
+        texts = AOI.strings.texts
+        count = len(AOI.languages)
+        return {
+            "diffs": [[AOI.diags[cell // count], AOI.languages[cell % count], texts[text_id]] for cell, text_id in self.diffs.items()],
+            "extra": [[diag, lan, texts[text_id]] for diag, lans in self.extra.items() for lan, text_id in lans.items()],
+        }
+
+    def rows(self):
+        """Return the rows with differences, as diagnostic row numbers."""
+        count = len(self.AOI.languages)
+        res = {cell // count for cell in self.diffs}
+        res.update(self.AOI.rows[diag] for diag in self.extra)
+        return res
+
+    def row_texts(self, row):
+        """Return (lan, text_local, text_aoi) of a diagnostic row, AOI languages first."""
+        AOI = self.AOI
+        texts = AOI.strings.texts
+        res = [(lan, texts[self.diffs.get(cell, text_id)], texts[text_id]) for cell, lan, text_id in AOI.row_languages(row)]
+        for lan, text_id in self.extra.get(AOI.diags[row], {}).items():
+            res.append((lan, texts[text_id], ""))
+        return res
+
+    def diagnostics(self):
+        """Return {diag: {lan: text}} of the AOI diagnostics, like CommentIndex.diagnostics."""
+        return {diag: {lan: text_local for lan, text_local, _ in self.row_texts(row)} for row, diag in enumerate(self.AOI.diags)}
+
+def used_texts(AOIs, instance_texts):
+    """Return the number of texts of the StringTable used by the AOIs and the InstanceTexts."""
+    used = {0}
+    for AOI in AOIs.values():
+        used.update(AOI.cells)
+    for texts in instance_texts:
+        used.update(texts.diffs.values())
+        for lans in texts.extra.values():
+            used.update(lans.values())
+    used.discard(ABSENT)
+    return len(used)
@@ -0,0 +1,57 @@
+
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from core.constants import VERSION
+
+
+class Profiler:
+    """Lightweight timing spans around the main phases, with their counts.
+
+    Use it as:
+
+        with profiler.span("load_AOIs") as counts:
+            ...
+            counts["AOIs"] = len(AOIs)
+
+    Only the last spans are kept, so long sessions use constant memory.
+    """
+
+    def __init__(self, max_spans=10000):
+        self.spans = deque(maxlen=max_spans)
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name, **counts):
+        if not self.enabled:
+            yield counts
+            return
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.spans.append({"name": name, "start": time.time(), "duration": time.perf_counter() - start, "counts": counts})
+
+    def clear(self):
+        self.spans.clear()
+
+    def summary(self):
+        """Return per phase the number of calls, total, last and max duration and last counts."""
+        res = {}
+        for span in list(self.spans):
+            phase = res.setdefault(span["name"], {"calls": 0, "total": 0.0, "max": 0.0})
+            phase["calls"] += 1
+            phase["total"] += span["duration"]
+            phase["max"] = max(phase["max"], span["duration"])
+            phase["last"] = span["duration"]
+            phase["counts"] = span["counts"]
+        return res
+
+    def write_json(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump({"version": VERSION, "summary": self.summary(), "spans": list(self.spans)}, f, indent=2)
+
+# Profiler shared by the whole application
+profiler = Profiler()
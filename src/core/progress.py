@@ -0,0 +1,66 @@
+
+import os
+import threading
+
+
+class Cancelled(Exception):
+    pass
+
+class Progress:
+    """Progress of a task running on a worker thread, polled by the GUI thread.
+
+    The worker reports the current phase and the fraction done with update,
+    which raises Cancelled once cancel has been called from the GUI.
+    """
+
+    def __init__(self):
+        self.phase = ""
+        self.fraction = 0.0
+        self._cancel = threading.Event()
+
+    def update(self, phase, fraction=0.0):
+        if self._cancel.is_set():
+            raise Cancelled()
+        self.phase = phase
+        self.fraction = min(max(fraction, 0.0), 1.0)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+def report(progress, phase, fraction=0.0):
+    """Update a progress object, if any."""
+    if progress is not None:
+        progress.update(phase, fraction)
+
+class ProgressReader:
+    """Read-only file wrapper reporting the bytes read, to follow parsing."""
+
+    def __init__(self, f, progress, phase):
+        self.f = f
+        self.progress = progress
+        self.phase = phase
+        self.size = os.fstat(f.fileno()).st_size or 1
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.progress.update(self.phase, self.f.tell() / self.size)
+        return data
+
+class ProgressWriter:
+    """Write-only file wrapper reporting the bytes written against an expected size."""
+
+    def __init__(self, f, progress, phase, expected_size):
+        self.f = f
+        self.progress = progress
+        self.phase = phase
+        self.expected_size = expected_size or 1
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        self.progress.update(self.phase, self.written / self.expected_size)
+        return self.f.write(data)
@@ -0,0 +1,156 @@
+
+import re
+
+from core.profiling import profiler
+
+
+def get_matcher(find, regex=False):
+    """Return a function telling if a text matches, raises re.error on a bad pattern."""
+    if regex:
+        return re.compile(find).search
+    return lambda text: find in text
+
+def replace_text(text, find, replacement, regex=False):
+    if regex:
+        return re.sub(find, replacement, text)
+    return text.replace(find, replacement)
+
+class TextIndex:
+    """Inverted index from text to the (instance, diag, lan) locations that have it.
+
+    It is built on the InstanceTexts of the validation cache: a text equal to
+    the AOI one is found through the AOI cells, so only the texts where an
+    instance differs from its AOI are indexed per instance. A search matches
+    every distinct text of the project once, without reading the XML.
+    Instances whose comments changed are reindexed on the next search.
+    """
+
+    def __init__(self, AOIs, instances, validation):
+        self.AOIs = AOIs
+        self.instances = instances
+        self.validation = validation
+        self.order = {ins_name: i for i, ins_name in enumerate(instances)}
+        self.by_AOI = {}     # AOI name -> [ins_name]
+        self.indexed = {}    # ins_name -> InstanceTexts indexed
+        self.locations = {}  # text id -> {(ins_name, diag, lan)} where the instance differs from its AOI
+        for ins_name, ins_data in instances.items():
+            self.by_AOI.setdefault(ins_data["datatype"], []).append(ins_name)
+
+    def refresh(self):
+        """Reindex the instances whose texts changed since the last search."""
+        count = 0
+        for ins_name in self.instances:
+            texts = self.validation.get_texts(ins_name)
+            old = self.indexed.get(ins_name)
+            if old is texts:
+                continue
+            if old is not None:
+                for key, text_id in self.iter_differences(ins_name, old):
+                    self.locations[text_id].discard(key)
+            for key, text_id in self.iter_differences(ins_name, texts):
+                self.locations.setdefault(text_id, set()).add(key)
+            self.indexed[ins_name] = texts
+            count += 1
+        return count
+
+    def iter_differences(self, ins_name, texts):
+        AOI = texts.AOI
+        count = len(AOI.languages)
+        for cell, text_id in texts.diffs.items():
+            yield (ins_name, AOI.diags[cell // count], AOI.languages[cell % count]), text_id
+        for diag, lans in texts.extra.items():
+            for lan, text_id in lans.items():
+                yield (ins_name, diag, lan), text_id
+
+    def search(self, find, regex=False, AOI_name=None, lan=None, diag_word=None):
+        """Return the (ins_name, diag, lan, text) locations whose text matches, in instance order.
+
+        The search can be limited to the instances of an AOI type, a language
+        and a diagnostic word ("idiagnostic1").
+        """
+        with profiler.span("search") as counts:
+            counts["reindexed"] = self.refresh()
+            matcher = get_matcher(find, regex)
+            if not self.AOIs or find == "":
+                counts["matches"] = 0
+                return []
+            texts = next(iter(self.AOIs.values())).strings.texts
+            matched = {text_id for text_id, text in enumerate(texts) if text and matcher(text)}
+
+            def selected(diag, cell_lan):
+                return (lan is None or cell_lan == lan) and (diag_word is None or diag.split(".")[0] == diag_word)
+
+            res = []
+            # Instances with the AOI text
+            for name, AOI in self.AOIs.items():
+                if AOI_name is not None and name != AOI_name:
+                    continue
+                cells = [(cell, diag, cell_lan, texts[text_id])
+                         for row, diag in enumerate(AOI.diags)
+                         for cell, cell_lan, text_id in AOI.row_languages(row)
+                         if text_id in matched and selected(diag, cell_lan)]
+                if not cells:
+                    continue
+                for ins_name in self.by_AOI.get(name, []):
+                    diffs = self.indexed[ins_name].diffs
+                    res += [(ins_name, diag, cell_lan, text) for cell, diag, cell_lan, text in cells if cell not in diffs]
+            # Instances with their own text
+            for text_id in matched:
+                for ins_name, diag, cell_lan in self.locations.get(text_id, ()):
+                    if (AOI_name is None or self.instances[ins_name]["datatype"] == AOI_name) and selected(diag, cell_lan):
+                        res.append((ins_name, diag, cell_lan, texts[text_id]))
+            res.sort(key=self.sort_key)
+            counts.update(texts=len(matched), matches=len(res))
+            return res
+
+    def sort_key(self, match):
+        """Sort matches like the diagnostics table: by instance, AOI row and language."""
+        ins_name, diag, lan, _ = match
+        AOI = self.AOIs[self.instances[ins_name]["datatype"]]
+        return self.order[ins_name], AOI.rows[diag], AOI.columns.get(lan, len(AOI.languages)), lan
+
+def replace_matches(instances, matches, find, replacement, regex=False):
+    """Replace the text of the matches in the instance comments.
+
+    Returns the names of the instances that changed.
+    """
+    changed = set()
+    with profiler.span("replace", matches=len(matches)) as counts:
+        for ins_name, diag, lan, text in matches:
+            new_text = replace_text(text, find, replacement, regex)
+            if new_text != text:
+                instances[ins_name]["comments"].set_text(diag, lan, new_text)
+                changed.add(ins_name)
+        counts["instances"] = len(changed)
+    return changed
+
+class NameIndex:
+    """Index of instance names by their lower-cased 3-letter substrings, for the panel filter.
+
+    A filter that extends the previous one only narrows its matches, so
+    typing a name letter by letter never rescans all the instances.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.lower = [name.lower() for name in self.names]
+        self.trigrams = {}  # 3 letters -> positions of the names that include them
+        for i, name in enumerate(self.lower):
+            for gram in {name[j:j + 3] for j in range(len(name) - 2)}:
+                self.trigrams.setdefault(gram, []).append(i)
+        self.last = ("", range(len(self.names)))
+
+    def filter(self, text):
+        """Return the names that include text, ignoring case, in their original order."""
+        text = text.lower()
+        last_text, last_res = self.last
+        if last_text and last_text in text:
+            candidates = last_res
+        elif len(text) >= 3:
+            grams = sorted((self.trigrams.get(text[j:j + 3], []) for j in range(len(text) - 2)), key=len)
+            candidates = grams[0]
+        else:
+            candidates = range(len(self.names))
+        res = [i for i in candidates if text in self.lower[i]]
+        self.last = (text, res)
+        return [self.names[i] for i in res]
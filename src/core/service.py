@@ -0,0 +1,267 @@
+"""Resident validation service answering questions about L5X projects over local HTTP.
+
+    python main.py --serve --port 8765 --memory-budget 1024
+
+Projects are loaded on first use and kept in memory, without their XML,
+until the memory budget is exceeded; the least recently used are dropped
+first. A project whose file changed on disk is reloaded on the next
+request, parsing again only the tags that changed. Every answer is JSON:
+
+    GET /projects
+    GET /status?file=PATH
+    GET /instances?file=PATH[&aoi=NAME][&status=ISSUE|OK]
+    GET /diagnostics?file=PATH&instance=NAME
+    GET /text?file=PATH&operand=TAG.iDiagnostic2.5[&lang=en-GB]
+
+Program tags are named like Program:MainProgram.TAG.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from core.constants import VERSION, STATUS_ISSUE
+from core.l5x import scan_project, split_operand, parse_AOI
+from core.validation import ValidationCache, validate_instance, status_from_color, color_name
+
+DEFAULT_PORT = 8765
+DEFAULT_MEMORY_BUDGET = 1024 * 1024 * 1024
+# Rough memory use of the loaded texts, see project_memory
+STRING_BYTES = 130
+INSTANCE_BYTES = 1000
+ENTRY_BYTES = 50
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def file_stat(file_path):
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def project_memory(AOIs, instances):
+    """Estimate in bytes the memory of a project loaded without XML."""
+    size = 0
+    if AOIs:
+        size += sum(STRING_BYTES + len(text) for text in next(iter(AOIs.values())).strings.texts)
+    for ins_data in instances.values():
+        texts = ins_data["comments"].texts(None)
+        size += INSTANCE_BYTES + ENTRY_BYTES * (len(texts.diffs) + sum(len(lans) for lans in texts.extra.values()))
+    return size
+
+class Project:
+    """A loaded and validated project. It does not change once built, so many threads can read it."""
+
+    def __init__(self, file_path, stat, scan, load_time, AOI_conflicts=()):
+        self.file_path = file_path
+        self.stat = stat
+        self.scan = scan  # Result of scan_project, for the next reload
+        self.AOIs, self.instances, _ = scan
+        self.load_time = load_time
+        self.AOI_conflicts = list(AOI_conflicts)  # AOIs that differ from the library copy of the same revision
+        self.loaded = time.time()
+        validation = ValidationCache(self.AOIs, self.instances)
+        self.counts = validation.color_counts()  # ins_name -> (red cells, orange cells)
+        self.colors = {ins_name: validation.color(ins_name) for ins_name in self.instances}
+        self.memory = project_memory(self.AOIs, self.instances)
+
+    def summary(self):
+        return {
+            "file": self.file_path,
+            "AOIs": len(self.AOIs),
+            "instances": len(self.instances),
+            "issues": sum(1 for color in self.colors.values() if status_from_color(color) == STATUS_ISSUE),
+            "memory": self.memory,
+            "AOI_conflicts": self.AOI_conflicts,
+            "loaded": self.loaded,
+            "load_time": self.load_time,
+        }
+
+    def instance_summary(self, ins_name):
+        red, orange = self.counts[ins_name]
+        return {
+            "instance": ins_name,
+            "datatype": self.instances[ins_name]["datatype"],
+            "scope": self.instances[ins_name]["scope"],
+            "status": status_from_color(self.colors[ins_name]),
+            "color": color_name(self.colors[ins_name]),
+            "red": int(red),
+            "orange": int(orange),
+        }
+
+    def get_texts(self, ins_name):
+        ins_data = self.instances.get(ins_name)
+        if ins_data is None:
+            raise QueryError(404, f"unknown instance {ins_name}")
+        return ins_data["comments"].texts(None)
+
+class ProjectStore:
+    """Loaded projects by file path, in least recently used order, within a memory budget.
+
+    Requests for loaded and unchanged projects are answered at once, from
+    any number of threads. Loads run one at a time, so the memory of two
+    big projects is never being built at once.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, library=None):
+        self.memory_budget = memory_budget
+        self.library = library  # AOILibrary shared by the loads, or None
+        self.projects = OrderedDict()
+        self.lock = threading.Lock()       # Guards projects
+        self.load_lock = threading.Lock()  # Held while loading
+
+    def get(self, file_path):
+        """Return the project of a file, loading it if it is not loaded or changed on disk."""
+        file_path = os.path.abspath(file_path)
+        project = self.get_loaded(file_path)
+        if project is not None:
+            return project
+        with self.load_lock:
+            # Another request may have loaded it while waiting
+            project = self.get_loaded(file_path)
+            if project is not None:
+                return project
+            with self.lock:
+                previous = self.projects.get(file_path)
+            stat = file_stat(file_path)
+            start = time.perf_counter()
+            reader = self.library.reader() if self.library is not None else None
+            scan = scan_project(file_path, previous.scan if previous is not None else None, keep_xml=False,
+                                parse=reader.parse if reader is not None else parse_AOI)
+            AOI_conflicts = []
+            if previous is not None and scan[0] is previous.AOIs:
+                AOI_conflicts = previous.AOI_conflicts  # The AOI definitions did not change
+            elif reader is not None:
+                AOI_conflicts = reader.save()["conflicts"]
+            project = Project(file_path, stat, scan, time.perf_counter() - start, AOI_conflicts)
+            with self.lock:
+                self.projects[file_path] = project
+                self.projects.move_to_end(file_path)
+                self.evict()
+            return project
+
+    def get_loaded(self, file_path):
+        try:
+            stat = file_stat(file_path)
+        except FileNotFoundError:
+            raise QueryError(404, f"file not found: {file_path}")
+        with self.lock:
+            project = self.projects.get(file_path)
+            if project is None or project.stat != stat:
+                return None
+            self.projects.move_to_end(file_path)
+            return project
+
+    def evict(self):
+        """Drop the least recently used projects over the memory budget, keeping the last one."""
+        total = sum(project.memory for project in self.projects.values())
+        while total > self.memory_budget and len(self.projects) > 1:
+            _, project = self.projects.popitem(last=False)
+            total -= project.memory
+
+    def summaries(self):
+        with self.lock:
+            projects = list(self.projects.values())
+        return [project.summary() for project in projects]
+
+def require(query, name):
+    value = query.get(name)
+    if not value:
+        raise QueryError(400, f"missing parameter {name}")
+    return value
+
+def get_projects(store, query):
+    return {"version": VERSION, "memory_budget": store.memory_budget, "projects": store.summaries()}
+
+def get_status(store, query):
+    return store.get(require(query, "file")).summary()
+
+def get_instances(store, query):
+    """Instances of a project, optionally only those of an AOI type and with a status."""
+    project = store.get(require(query, "file"))
+    AOI_name = query.get("aoi")
+    status = query.get("status")
+    res = []
+    for ins_name, ins_data in project.instances.items():
+        if AOI_name is not None and ins_data["datatype"] != AOI_name:
+            continue
+        if status is not None and status_from_color(project.colors[ins_name]) != status:
+            continue
+        res.append(project.instance_summary(ins_name))
+    return {"file": project.file_path, "instances": res}
+
+def get_diagnostics(store, query):
+    """The rows of the diagnostics table of an instance."""
+    project = store.get(require(query, "file"))
+    ins_name = require(query, "instance")
+    rows, _ = validate_instance(project.get_texts(ins_name))
+    return {
+        **project.instance_summary(ins_name),
+        "rows": [{"operand": diag, "lang": lan, "text": text_local, "AOI_text": text_aoi, "color": color_name(color)}
+                 for diag, lan, text_local, text_aoi, color in rows],
+    }
+
+def get_text(store, query):
+    """The texts of an operand like TAG.iDiagnostic2.5, in one or every language."""
+    project = store.get(require(query, "file"))
+    operand = require(query, "operand")
+    ins_name, diag = split_operand(operand)
+    texts = project.get_texts(ins_name)
+    row = texts.AOI.rows.get(diag.lower())
+    if row is None:
+        raise QueryError(404, f"unknown operand {operand}")
+    by_language = {lan: text_local for lan, text_local, _ in texts.row_texts(row)}
+    lan = query.get("lang")
+    if lan is not None:
+        return {"operand": operand, "lang": lan, "text": by_language.get(lan, "")}
+    return {"operand": operand, "texts": by_language}
+
+ROUTES = {
+    "/projects": get_projects,
+    "/status": get_status,
+    "/instances": get_instances,
+    "/diagnostics": get_diagnostics,
+    "/text": get_text,
+}
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        route = ROUTES.get(url.path)
+        try:
+            if route is None:
+                raise QueryError(404, f"unknown path {url.path}")
+            status, body = 200, route(self.server.store, query)
+        except QueryError as e:
+            status, body = e.status, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def create_server(port=DEFAULT_PORT, memory_budget=DEFAULT_MEMORY_BUDGET, host="127.0.0.1", library=None):
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.store = ProjectStore(memory_budget, library)
+    return server
+
+def serve(port=DEFAULT_PORT, memory_budget=DEFAULT_MEMORY_BUDGET, host="127.0.0.1", library=None):
+    """Answer requests until interrupted."""
+    server = create_server(port, memory_budget, host, library)
+    print(f"Serving on http://{host}:{server.server_address[1]}, memory budget {memory_budget // (1024 * 1024)} MB")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,225 @@
+
+from core.constants import (
+    LANGUAGES, DIAG_TYPES, USER_DIAG_TEXTS, NOT_ALLOWED_TEXTS,
+    COLOR_WHITE, COLOR_RED, COLOR_ORANGE, STATUS_OK, STATUS_ISSUE,
+)
+from core import columnar
+from core.l5x import get_aoi_diagnostics
+from core.model import InstanceTexts
+from core.profiling import profiler
+from core.progress import report
+
+COLOR_NAMES = {
+    tuple(COLOR_WHITE): "white",
+    tuple(COLOR_ORANGE): "orange",
+    tuple(COLOR_RED): "red",
+}
+
+
+def color_name(color):
+    return COLOR_NAMES.get(tuple(color), "unknown")
+
+def color_from_name(name):
+    for color, color_name in COLOR_NAMES.items():
+        if color_name == name:
+            return list(color)
+    return COLOR_WHITE
+
+def status_from_color(instance_color):
+    return STATUS_OK if instance_color != COLOR_RED else STATUS_ISSUE
+
+def worst_color(color, other):
+    if COLOR_RED in (color, other):
+        return COLOR_RED
+    if COLOR_ORANGE in (color, other):
+        return COLOR_ORANGE
+    return COLOR_WHITE
+
+def classify_row(row_texts):
+    """Return the color of every (lan, text_local, text_aoi) cell of a diagnostic row."""
+    # Check if language description is consistent
+    lan_desc_count = 0
+    for lan, text_local, text_aoi in row_texts:
+        if (text_local != text_aoi) and (text_local != ""):
+            lan_desc_count += 1
+    both_lan_exist = (lan_desc_count == len(row_texts)) or (lan_desc_count == 0)
+    colors = []
+    for lan, text_local, text_aoi in row_texts:
+        color = COLOR_WHITE
+        if lan not in LANGUAGES:
+            # Language not supported
+            color = COLOR_RED
+        # local text includes special character combination
+        elif "<@" in text_local:
+            color = COLOR_RED
+        elif text_local != text_aoi:
+            # Both language descriptions do not exist
+            if not both_lan_exist:
+                color = COLOR_RED
+            # Empty text. Text is going to be replaced with AOI text
+            elif text_local == "":
+                color = COLOR_ORANGE
+            # Not allowed diagnostic text, will be overwritten
+            elif text_aoi in NOT_ALLOWED_TEXTS:
+                color = COLOR_RED
+            # User defined text in AOI specific bit
+            elif text_aoi[:2] not in DIAG_TYPES:
+                color = COLOR_RED
+            # User defined text that differs from AOI type
+            elif text_aoi in USER_DIAG_TEXTS and text_local[:2] != text_aoi[:2]:
+                color = COLOR_RED
+        colors.append(color)
+    return colors
+
+def validate_instance(texts):
+    """Classify every (diagnostic, language) cell of an instance against its AOI.
+
+    Returns the table rows as (diag, lan, text_local, text_aoi, color) tuples
+    and the color of the instance, which is the worst color of its rows.
+    """
+    rows = []
+    instance_color = COLOR_WHITE
+    for row, diag in enumerate(texts.AOI.diags):
+        row_texts = texts.row_texts(row)
+        for (lan, text_local, text_aoi), color in zip(row_texts, classify_row(row_texts)):
+            instance_color = worst_color(instance_color, color)
+            rows.append((diag, lan, text_local, text_aoi, color))
+    return rows, instance_color
+
+def AOI_row_colors(AOI):
+    """Return (row, color) of the diagnostic rows that are not white for an instance with exactly the AOI texts."""
+    texts = InstanceTexts(AOI)
+    res = []
+    for row in range(len(AOI.diags)):
+        color = COLOR_WHITE
+        for cell_color in classify_row(texts.row_texts(row)):
+            color = worst_color(color, cell_color)
+        if color != COLOR_WHITE:
+            res.append((row, color))
+    return res
+
+def instance_color(texts, AOI_colors):
+    """Return the color of an instance, checking only the rows where it differs from its AOI."""
+    changed = texts.rows()
+    color = COLOR_WHITE
+    for row, row_color in AOI_colors:
+        if row not in changed:
+            color = worst_color(color, row_color)
+    for row in changed:
+        if color == COLOR_RED:
+            break
+        for cell_color in classify_row(texts.row_texts(row)):
+            color = worst_color(color, cell_color)
+    return color
+
+class ValidationCache:
+    """Validation results per instance, revalidated only when they are stale.
+
+    A result is stale when the comments of the instance changed since it was
+    computed (see CommentIndex.version) or when its AOI was invalidated.
+    """
+
+    def __init__(self, AOIs, instances):
+        self.AOIs = AOIs
+        self.instances = instances
+        self.results = {}       # ins_name -> (comments version, AOI version, InstanceTexts, instance color)
+        self.diag_aois = {}     # AOI name -> {diag: {lan: text}}, for the fix plans
+        self.AOI_colors = {}    # AOI name -> (row, color) of the rows that are not white
+        self.AOI_versions = {}  # AOI name -> version
+        self.flags = None       # columnar.TextFlags of the project texts
+
+    def invalidate(self, ins_name):
+        self.results.pop(ins_name, None)
+
+    def invalidate_AOI(self, AOI_name):
+        """Mark all instances of an AOI as stale, after its definition changed."""
+        self.diag_aois.pop(AOI_name, None)
+        self.AOI_colors.pop(AOI_name, None)
+        self.AOI_versions[AOI_name] = self.AOI_versions.get(AOI_name, 0) + 1
+
+    def is_dirty(self, ins_name):
+        res = self.results.get(ins_name)
+        if res is None:
+            return True
+        ins_data = self.instances[ins_name]
+        return res[0] != ins_data["comments"].version or res[1] != self.AOI_versions.get(ins_data["datatype"], 0)
+
+    def get_diag_aoi(self, AOI_name):
+        if AOI_name not in self.diag_aois:
+            self.diag_aois[AOI_name] = get_aoi_diagnostics(self.AOIs, AOI_name)
+        return self.diag_aois[AOI_name]
+
+    def get_AOI_colors(self, AOI_name):
+        if AOI_name not in self.AOI_colors:
+            self.AOI_colors[AOI_name] = AOI_row_colors(self.AOIs[AOI_name])
+        return self.AOI_colors[AOI_name]
+
+    def revalidate(self, ins_name):
+        """Return the cached result of an instance, revalidating it if stale."""
+        if self.is_dirty(ins_name):
+            ins_data = self.instances[ins_name]
+            datatype = ins_data["datatype"]
+            texts = ins_data["comments"].texts(self.AOIs[datatype])
+            color = instance_color(texts, self.get_AOI_colors(datatype))
+            self.results[ins_name] = (ins_data["comments"].version, self.AOI_versions.get(datatype, 0), texts, color)
+        return self.results[ins_name]
+
+    def get_texts(self, ins_name):
+        return self.revalidate(ins_name)[2]
+
+    def color(self, ins_name):
+        return self.revalidate(ins_name)[3]
+
+    def get(self, ins_name):
+        """Return (rows, instance color) of an instance, the rows are built from its texts on demand."""
+        texts, color = self.revalidate(ins_name)[2:]
+        return validate_instance(texts)[0], color
+
+    def validate_many(self, ins_names, progress=None):
+        """Revalidate instances all at once with the columnar engine.
+
+        Returns {ins_name: (red cells, orange cells)}.
+        """
+        texts_list = []
+        versions = []
+        count = len(ins_names)
+        for i, ins_name in enumerate(ins_names):
+            if i % 1000 == 0:
+                report(progress, "validate", i / count)
+            ins_data = self.instances[ins_name]
+            datatype = ins_data["datatype"]
+            texts_list.append(ins_data["comments"].texts(self.AOIs[datatype]))
+            versions.append((ins_data["comments"].version, self.AOI_versions.get(datatype, 0)))
+        if not texts_list:
+            return {}
+        if self.flags is None:
+            self.flags = columnar.TextFlags(texts_list[0].AOI.strings)
+        colors, red, orange = columnar.validate(texts_list, self.flags)
+        for ins_name, (version, AOI_version), texts, color in zip(ins_names, versions, texts_list, colors):
+            self.results[ins_name] = (version, AOI_version, texts, columnar.CODE_COLORS[color])
+        return {ins_name: (int(red[i]), int(orange[i])) for i, ins_name in enumerate(ins_names)}
+
+    def validate_all(self, progress=None):
+        """Revalidate the stale instances and return the status of every instance."""
+        res = {}
+        count = len(self.instances)
+        with profiler.span("validate", instances=count) as counts:
+            dirty = [ins_name for ins_name in self.instances if self.is_dirty(ins_name)]
+            counts["revalidated"] = len(dirty)
+            if columnar.available():
+                self.validate_many(dirty, progress)
+            for i, ins_name in enumerate(self.instances):
+                if i % 1000 == 0:
+                    report(progress, "validate", i / count)
+                res[ins_name] = status_from_color(self.color(ins_name))
+        return res
+
+    def color_counts(self):
+        """Return {ins_name: (red cells, orange cells)} of every instance."""
+        if columnar.available():
+            return self.validate_many(list(self.instances))
+        res = {}
+        for ins_name in self.instances:
+            colors = [row[4] for row in self.get(ins_name)[0]]
+            res[ins_name] = (colors.count(COLOR_RED), colors.count(COLOR_ORANGE))
+        return res
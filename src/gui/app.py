@@ -1,157 +1,358 @@
 
+import os
+import re
+import threading
+import time
+
 import dearpygui.dearpygui as dpg
-from lxml import etree
-
-VERSION = "0.1.10"
-KEY_LANGUAGE = "en-GB"
-LANGUAGES = [KEY_LANGUAGE, "sv-SE"]
-DIAGNOSTIC_WORDS = ["idiagnostic1", "idiagnostic2", "idiagnostic3"]
-DIAG_TYPES = ["UF", "UW", "UM", "SF", "SW", "SM"]
-USER_DIAG_TEXTS = [f"{dt}_{i:02d}" for dt in DIAG_TYPES for i in range(64)]
-COLOR_WHITE = [255,255,255,255]
-COLOR_RED = [200,0,0,255]
-COLOR_ORANGE = [255,165,0,255]
-COLOR_PURPLE = [128,0,128,255]
-STATUS_OK = "OK"
-STATUS_ISSUE = "ISSUE"
+
+from core.constants import VERSION, LANGUAGES, DIAGNOSTIC_WORDS, COLOR_WHITE, COLOR_RED, COLOR_ORANGE, COLOR_PURPLE, STATUS_OK
+from core import l5x
+from core.validation import ValidationCache, status_from_color
+from core.fix import fix_plan, fix_instance, fix_instances, new_summary
+from core.memory import format_size, PeakMemory
+from core.cache import project_data, cached_project
+from core.export import export_diagnostics, import_diagnostics
+from core.clipboard import copy_instances, paste_instances
+from core.journal import Journal
+from core.search import TextIndex, NameIndex, replace_matches, replace_text
+from core.progress import Progress, Cancelled, report
+from core.profiling import profiler
+
+# Matches shown in the find and replace preview
+PREVIEW_ROWS = 1000
+# Instances shown in a group of the instance panel
+GROUP_ROWS = 2000
+STATUSES = ["ISSUE", "OK"]
+# Text inputs outside the diagnostics table, where Ctrl+Z and Ctrl+Y belong to the input
+TEXT_INPUTS = ["instance_filter", "project_find_input", "project_replace_input"]
 
 class App:
-    def __init__(self):
+    def __init__(self, profile_log=None, cache=None, library=None):
+        self.task = None  # Background task being run, see start_task
+        self.cache = cache  # ProjectCache of previously loaded files, or None
+        self.library = library  # AOILibrary of the AOI definitions already parsed, or None
+        self.profile_log = profile_log  # JSON file where the timing spans are written on exit
         self.clear()
 
     def clear(self):
         self._keep_alive = True
-        self.key_language_desc = {}
         self.instances = {} # Dict with loaded AOI instances
         self.instance_status = {} # Dict with instance diagnostic status
+        self.instance_colors = {} # Dict with instance color
+        self.groups = {}          # (AOI name, status) -> group of the instance panel, see create_instance_groups
+        self.dirty_groups = set() # Groups to fill again, see refresh_groups
+        self.widget_instances = {}  # Selectable of the instance panel -> instance name
+        self.selected_widget = None
+        self.selected_instances = set()  # Instances added with Ctrl+click, copied together with the current one
+        self.name_index = None    # NameIndex of the instance names, for the panel filter
+        self.filtered = None      # Instance names matching the panel filter, None without filter
+        self.instance_order = {}  # Instance name -> position in the project
+        self.validation = None    # Cached validation results per instance
+        self.text_index = None    # TextIndex for the project find and replace, built on first use
         self.AOIs = {}      # Dict with loaded AOI definitions
+        self.AOI_conflicts = set()  # AOIs that differ from the library copy of the same revision
+        self.tree = None
+        self.file_path = None
+        self.from_cache = False  # Project shown from the cache, without DOM
+        self.saved_file = None   # l5x.SavedFile the changed tags are spliced into on save
+        self.journal = Journal()  # Undo and redo of the comment changes
         self.current_instance = None
         self.editing = False
         self.edit_inputs = {}
+        self.table_rows = []  # Recycled rows of the diagnostics table
+        self.shown_rows = 0
 
     def exit_app(self, sender):
         self._keep_alive = False
     
-    def select_load_file(self, sender):
-        with dpg.file_dialog(directory_selector=False, show=True, width=700 ,height=400, callback=self.load_callback):
+    def select_load_file(self, sender, app_data=None, user_data=False):
+        with dpg.file_dialog(directory_selector=False, show=True, width=700 ,height=400, callback=self.load_callback, user_data=user_data):
             dpg.add_file_extension(extension=".L5X,.l5x")    
 
     def select_save_file(self, sender):
         with dpg.file_dialog(directory_selector=False, show=True, width=700 ,height=400, callback=self.save_callback):
             dpg.add_file_extension(extension=".L5X,.l5x")
     
+    def select_import_diagnostics(self, sender):
+        with dpg.file_dialog(directory_selector=False, show=True, width=700 ,height=400, callback=self.import_callback):
+            dpg.add_file_extension(extension=".TXT,.txt")
+
     def select_export_diagnostics(self, sender):
         with dpg.file_dialog(directory_selector=False, show=True, width=700 ,height=400, callback=self.export_callback):
             dpg.add_file_extension(extension=".TXT,.txt")        
     
-    def node_selected(self, sender):  
-        # Unselect other instances and select actual
-        children = dpg.get_item_children("Instances", 1)  # 1 = slot for items
-        if children:
-            for child in children:
-                dpg.set_value(child, False)
+    def node_selected(self, sender):
+        if dpg.is_key_down(dpg.mvKey_ModCtrl):
+            # Ctrl+click adds the instance to the selection for copy, or removes it
+            ins_name = self.widget_instances.get(sender)
+            if ins_name is not None and ins_name != self.current_instance:
+                self.selected_instances ^= {ins_name}
+                dpg.set_value(sender, ins_name in self.selected_instances)
+            else:
+                dpg.set_value(sender, True)
+            return
+        self.clear_selection()
+        # Unselect the previous instance and select actual
+        if self.selected_widget is not None and dpg.does_item_exist(self.selected_widget):
+            dpg.set_value(self.selected_widget, False)
         dpg.set_value(sender, True)
+        self.selected_widget = sender
         # If editing, cancel first
         if self.editing:
             self.cancel_edits(None)
         # Display corresponding diagnostics and remember selection
+        ins_name = self.widget_instances.get(sender)
+        if ins_name is not None:
+            self.current_instance = ins_name
+            self.display_diagnostics(ins_name)
+
+    def select_instance(self, ins_name):
+        """Open the group of an instance in the instance panel and select it."""
+        key = (self.instances[ins_name]["datatype"], self.instance_status[ins_name])
+        if self.filtered is not None and ins_name not in self.filtered:
+            dpg.set_value("instance_filter", "")
+            self.filter_instances(None, "")
+        group = self.groups[key]
+        if not group["filled"] or key in self.dirty_groups:
+            self.fill_group(key)
+        dpg.set_value(group["type_node"], True)
+        dpg.set_value(group["node"], True)
+        if self.instances[ins_name]["tree_node"]:
+            self.node_selected(self.instances[ins_name]["tree_node"])
+        else:
+            # Not among the first GROUP_ROWS of its group
+            self.current_instance = ins_name
+            self.display_diagnostics(ins_name)
+
+    def create_instance_groups(self):
+        """Create the instance panel groups by AOI type and status, without their instances.
+
+        The selectables of a group are only created when it is opened.
+        """
+        self.groups = {}
+        self.dirty_groups = set()
+        self.widget_instances = {}
+        self.selected_widget = None
+        members = {}
         for ins_name, ins_data in self.instances.items():
-            if ins_data["tree_node"] == sender:
-                self.current_instance = ins_name
-                self.display_diagnostics(ins_name)
-                break
-    
+            members.setdefault(ins_data["datatype"], {status: set() for status in STATUSES})[self.instance_status[ins_name]].add(ins_name)
+        for datatype in sorted(members):
+            with dpg.tree_node(label=datatype, parent="Instances") as type_node:
+                for status in STATUSES:
+                    key = (datatype, status)
+                    with dpg.tree_node(label=status) as node:
+                        pass
+                    with dpg.item_handler_registry() as handler:
+                        dpg.add_item_toggled_open_handler(callback=self.group_opened, user_data=key)
+                    dpg.bind_item_handler_registry(node, handler)
+                    self.groups[key] = {"type_node": type_node, "node": node, "members": members[datatype][status], "widgets": [], "filled": False}
+        self.update_group_labels()
+
+    def group_opened(self, sender, app_data, key):
+        if not self.groups[key]["filled"] or key in self.dirty_groups:
+            self.fill_group(key)
+
+    def group_members(self, key):
+        members = self.groups[key]["members"]
+        if self.filtered is not None:
+            members = members & self.filtered
+        return sorted(members, key=self.instance_order.get)
+
+    def fill_group(self, key):
+        """Create the selectables of the instances of a group."""
+        group = self.groups[key]
+        for widget in group["widgets"]:
+            ins_name = self.widget_instances.pop(widget, None)
+            if ins_name is not None:
+                self.instances[ins_name]["tree_node"] = 0
+            dpg.delete_item(widget)
+        group["widgets"] = []
+        members = self.group_members(key)
+        for ins_name in members[:GROUP_ROWS]:
+            widget = dpg.add_selectable(label=ins_name, parent=group["node"], callback=self.node_selected)
+            dpg.bind_item_theme(widget, self.get_theme(self.instance_colors[ins_name]))
+            self.instances[ins_name]["tree_node"] = widget
+            self.widget_instances[widget] = ins_name
+            group["widgets"].append(widget)
+            if ins_name == self.current_instance:
+                dpg.set_value(widget, True)
+                self.selected_widget = widget
+            elif ins_name in self.selected_instances:
+                dpg.set_value(widget, True)
+        if len(members) > GROUP_ROWS:
+            group["widgets"].append(dpg.add_text(f"... {len(members) - GROUP_ROWS} more, use the filter", parent=group["node"]))
+        group["filled"] = True
+        self.dirty_groups.discard(key)
+
+    def refresh_groups(self):
+        """Fill again the opened groups whose instances changed, and update the counts."""
+        if not self.dirty_groups:
+            return
+        for key in list(self.dirty_groups):
+            if self.groups[key]["filled"]:
+                self.fill_group(key)
+        self.dirty_groups = set()
+        self.update_group_labels()
+
+    def update_group_labels(self):
+        type_counts = {}
+        for (datatype, status), group in self.groups.items():
+            count = len(group["members"] & self.filtered) if self.filtered is not None else len(group["members"])
+            dpg.configure_item(group["node"], label=f"{status} ({count})", show=count > 0)
+            type_counts[datatype] = type_counts.get(datatype, 0) + count
+        for (datatype, status), group in self.groups.items():
+            dpg.configure_item(group["type_node"], label=f"{datatype} ({type_counts[datatype]})", show=type_counts[datatype] > 0)
+
+    def filter_instances(self, sender, app_data):
+        """Narrow the instance panel to the instances whose name includes the filter text."""
+        with profiler.span("filter_instances") as counts:
+            self.filtered = set(self.name_index.filter(app_data)) if app_data else None
+            counts["matches"] = len(self.instances) if self.filtered is None else len(self.filtered)
+            self.dirty_groups.update(self.groups.keys())
+            self.refresh_groups()
+
     def clear_diagnostics(self):
-        children = dpg.get_item_children("diag_table", 1)  # 1 = slot for items
-        if children:
-            for child in children:
-                dpg.delete_item(child)
-    
+        # Rows are recycled, just hide them
+        for table_row in self.table_rows[:self.shown_rows]:
+            dpg.configure_item(table_row["row"], show=False)
+        self.shown_rows = 0
+
+    def get_table_row(self, i):
+        """Return the i-th row of the diagnostics table, creating the missing ones."""
+        while len(self.table_rows) <= i:
+            with dpg.table_row(parent="diag_table", show=False) as row:
+                table_row = {"row": row, "color": None}
+                table_row["diag"] = dpg.add_text("")
+                table_row["lan"] = dpg.add_text("")
+                with dpg.group():
+                    table_row["text"] = dpg.add_text("")
+                    table_row["input"] = dpg.add_input_text(width=-1, show=False)
+                    with dpg.popup(table_row["input"], mousebutton=dpg.mvMouseButton_Right, modal=False):
+                        dpg.add_menu_item(label="Copy", callback=self.copy_text, user_data=table_row["input"])
+                        dpg.add_menu_item(label="Paste", callback=self.paste_text, user_data=table_row["input"])
+                        dpg.add_menu_item(label="Cut", callback=self.cut_text, user_data=table_row["input"])
+                table_row["aoi"] = dpg.add_text("")
+            self.table_rows.append(table_row)
+        return self.table_rows[i]
+
     def display_diagnostics(self, ins_name, show_table=True):
-        self.clear_diagnostics()
+        with profiler.span("display_diagnostics") as counts:
+            self._display_diagnostics(ins_name, show_table, counts)
+
+    def _display_diagnostics(self, ins_name, show_table, counts):
         if self.editing:
             self.edit_inputs = {}
-        # AOI Diagnostics
-        diag_aoi = self.AOIs[self.instances[ins_name]["datatype"]].copy()
-        diag_aoi.pop("Revision", None)
-        # Local Diagnostics
-        diag_local = self.get_instance_diagnostics(self.instances[ins_name]["XML_node"])
-        # Instance color
-        instance_color = COLOR_WHITE
-        # Populate table
-        for diag, texts_aoi in diag_aoi.items():
-            lans = list(texts_aoi.keys())
-            if diag in diag_local:
-                lans += list(diag_local[diag].keys())
-            lans = set(lans)
-            # Check if language description is consistent
-            lan_desc_count = 0
-            for lan in lans:
-                if diag in diag_local:
-                    if (diag_local[diag][lan] != texts_aoi.get(lan, "")) and (diag_local[diag][lan] != ""):
-                        lan_desc_count += 1
-            both_lan_exist = (lan_desc_count == len(lans)) or (lan_desc_count == 0)
-            for lan in lans:
-                text_local = diag_local[diag][lan] if diag in diag_local else ""
-                text_aoi = texts_aoi.get(lan, "")
-                color = COLOR_WHITE
-                if lan not in LANGUAGES:
-                    # Language not supported
-                    color = COLOR_RED
-                    instance_color = COLOR_RED
-                # local text includes special character combination
-                elif "<@" in text_local:
-                    color = COLOR_RED
-                    instance_color = COLOR_RED                        
-                elif text_local != text_aoi:
-                    # Both language descriptions do not exist
-                    if not both_lan_exist:
-                        color = COLOR_RED
-                        instance_color = COLOR_RED
-                    # Empty text. Text is going to be replaced with AOI text
-                    elif text_local == "":
-                        color = COLOR_ORANGE
-                        instance_color = COLOR_ORANGE if instance_color != COLOR_RED else instance_color
-                    # Not allowed diagnostic text, will be overwritten
-                    elif text_aoi in ["DO NOT USE", "ANVÄND EJ"]:
-                        color = COLOR_RED
-                        instance_color = COLOR_RED
-                    # User defined text in AOI specific bit
-                    elif text_aoi[:2] not in DIAG_TYPES:
-                        color = COLOR_RED
-                        instance_color = COLOR_RED
-                    # User defined text that differs from AOI type
-                    elif text_aoi in USER_DIAG_TEXTS and text_local[:2] != text_aoi[:2]:
-                        color = COLOR_RED
-                        instance_color = COLOR_RED
-                if show_table:
-                    with dpg.table_row(parent="diag_table") as row:
-                        dpg.add_text(diag)
-                        dpg.add_text(lan)
-                        if self.editing:
-                            input_tag = f"input_{diag}_{lan}"
-                            input_widget = dpg.add_input_text(default_value=text_local, tag=input_tag)
-                            with dpg.popup(input_widget, mousebutton=dpg.mvMouseButton_Right, modal=False):
-                                dpg.add_menu_item(label="Copy", callback=self.copy_text, user_data=input_tag)
-                                dpg.add_menu_item(label="Paste", callback=self.paste_text, user_data=input_tag)
-                                dpg.add_menu_item(label="Cut", callback=self.cut_text, user_data=input_tag)
-                            self.edit_inputs[(diag, lan)] = input_tag
-                        else:
-                            dpg.add_text(text_local)
-                        dpg.add_text(text_aoi) 
-                    with dpg.theme() as theme_id:
-                        with dpg.theme_component(0):
-                            dpg.add_theme_color(dpg.mvThemeCol_Text, color, category=dpg.mvThemeCat_Core)
-                        dpg.bind_item_theme(row, theme_id)
-    
-        # Mark Instance with color
-        self.instance_status[ins_name] = STATUS_OK if instance_color != COLOR_RED else STATUS_ISSUE
-        with dpg.theme() as theme_id:
-            with dpg.theme_component(0):
-                dpg.add_theme_color(dpg.mvThemeCol_Text, instance_color, category=dpg.mvThemeCat_Core)
-            dpg.bind_item_theme(self.instances[ins_name]["tree_node"], theme_id)                
+        # Cached rows, revalidated only if the instance or its AOI changed
+        counts["revalidated"] = int(self.validation.is_dirty(ins_name))
+        rows, instance_color = self.validation.get(ins_name)
+        counts["rows"] = len(rows) if show_table else 0
+        # Populate table, reusing the row widgets and updating their values only
+        if show_table:
+            for i, (diag, lan, text_local, text_aoi, color) in enumerate(rows):
+                table_row = self.get_table_row(i)
+                dpg.set_value(table_row["diag"], diag)
+                dpg.set_value(table_row["lan"], lan)
+                dpg.set_value(table_row["aoi"], text_aoi)
+                if self.editing:
+                    dpg.set_value(table_row["input"], text_local)
+                    self.edit_inputs[(diag, lan)] = table_row["input"]
+                else:
+                    dpg.set_value(table_row["text"], text_local)
+                dpg.configure_item(table_row["text"], show=not self.editing)
+                dpg.configure_item(table_row["input"], show=self.editing)
+                if table_row["color"] != color:
+                    dpg.bind_item_theme(table_row["row"], self.get_theme(color))
+                    table_row["color"] = color
+                dpg.configure_item(table_row["row"], show=True)
+            for table_row in self.table_rows[len(rows):self.shown_rows]:
+                dpg.configure_item(table_row["row"], show=False)
+            self.shown_rows = len(rows)
+        self.mark_instance(ins_name, instance_color)
+
+    def mark_instance(self, ins_name, instance_color):
+        """Mark Instance with color"""
+        status = status_from_color(instance_color)
+        old_status = self.instance_status.get(ins_name)
+        self.instance_status[ins_name] = status
+        self.instance_colors[ins_name] = instance_color
+        if old_status is not None and old_status != status and self.groups:
+            # Move the instance to the group of its new status
+            datatype = self.instances[ins_name]["datatype"]
+            self.groups[(datatype, old_status)]["members"].discard(ins_name)
+            self.groups[(datatype, status)]["members"].add(ins_name)
+            self.dirty_groups.update([(datatype, old_status), (datatype, status)])
+        if self.instances[ins_name]["tree_node"]:
+            dpg.bind_item_theme(self.instances[ins_name]["tree_node"], self.get_theme(instance_color))
+
+    def create_themes(self):
+        """Create one text color theme per status color, shared by all rows and instances."""
+        self.themes = {}
+        for color in [COLOR_WHITE, COLOR_ORANGE, COLOR_RED, COLOR_PURPLE]:
+            with dpg.theme() as theme_id:
+                with dpg.theme_component(0):
+                    dpg.add_theme_color(dpg.mvThemeCol_Text, color, category=dpg.mvThemeCat_Core)
+            self.themes[tuple(color)] = theme_id
+
+    def get_theme(self, color):
+        return self.themes[tuple(color)]
+
+    def show_item_counter(self, sender):
+        if dpg.does_item_exist("item_counter_window"):
+            dpg.focus_item("item_counter_window")
+            return
+        with dpg.window(label="Item counter", tag="item_counter_window", width=220, height=80, on_close=lambda: dpg.delete_item("item_counter_window")):
+            dpg.add_text("", tag="item_counter_text")
+        self.update_item_counter()
+
+    def update_item_counter(self):
+        """Show the number of live dearpygui items, it should stay flat while browsing."""
+        if dpg.does_item_exist("item_counter_text"):
+            dpg.set_value("item_counter_text", f"Live items: {len(dpg.get_all_items())}")
+
+    def show_performance(self, sender):
+        if dpg.does_item_exist("performance_window"):
+            dpg.focus_item("performance_window")
+            return
+        with dpg.window(label="Performance", tag="performance_window", width=620, height=300, on_close=lambda: dpg.delete_item("performance_window")):
+            with dpg.group(horizontal=True):
+                dpg.add_button(label="Clear", callback=lambda: (profiler.clear(), self.update_performance()))
+                dpg.add_button(label="Save JSON", callback=self.select_save_profile)
+            with dpg.table(tag="performance_table", header_row=True, resizable=True, borders_innerH=True, borders_innerV=True, policy=dpg.mvTable_SizingStretchProp):
+                for label in ["Phase", "Calls", "Last (s)", "Max (s)", "Total (s)", "Last counts"]:
+                    dpg.add_table_column(label=label)
+        self.update_performance()
+
+    def update_performance(self):
+        """Show the timing spans summary in the Performance window, if open."""
+        if not dpg.does_item_exist("performance_table"):
+            return
+        children = dpg.get_item_children("performance_table", 1)
+        if children:
+            for child in children:
+                dpg.delete_item(child)
+        for phase, summary in profiler.summary().items():
+            with dpg.table_row(parent="performance_table"):
+                dpg.add_text(phase)
+                dpg.add_text(str(summary["calls"]))
+                dpg.add_text(f"{summary['last']:.4f}")
+                dpg.add_text(f"{summary['max']:.4f}")
+                dpg.add_text(f"{summary['total']:.4f}")
+                dpg.add_text(", ".join(f"{name}={value}" for name, value in summary["counts"].items()))
+
+    def select_save_profile(self, sender):
+        with dpg.file_dialog(directory_selector=False, show=True, width=700 ,height=400, callback=self.save_profile_callback):
+            dpg.add_file_extension(extension=".json")
+
+    def save_profile_callback(self, sender, file_data):
+        try:
+            profiler.write_json(file_data['file_path_name'])
+        except Exception as e:
+            print("Error saving profile:", e)
 
     def edit_diagnostics(self, sender):
+        if self.needs_full_project(self.edit_diagnostics, sender):
+            return
         self.editing = True
         dpg.configure_item("edit_button", show=False)
         dpg.configure_item("save_button", show=True)
@@ -169,32 +370,13 @@ class App:
             if diag not in diag_local:
                 diag_local[diag] = {}
             diag_local[diag][lan] = text
-        # Update XML
-        xml_node = self.instances[self.current_instance]["XML_node"]
-        comments = xml_node.find("Comments")
-        if comments is None:
-            comments = etree.Element("Comments")
-            alarm_conditions = xml_node.find("AlarmConditions")
-            if alarm_conditions is not None:
-                index = list(xml_node).index(alarm_conditions) + 1
-                xml_node.insert(index, comments)
-            else:
-                xml_node.insert(0, comments)
-        for diag, texts in diag_local.items():
-            for comment in comments.findall("Comment"):
-                if comment.attrib.get("Operand").lower()[1:] == diag:
-                    for lan, text in texts.items():
-                        for loc in comment.findall("LocalizedComment"):
-                            if loc.attrib.get("Lang") == lan:
-                                loc.text = etree.CDATA(text)
-                                break
-                        else:
-                            etree.SubElement(comment, "LocalizedComment", {"Lang": lan}).text = etree.CDATA(text)
-                    break
-            else:
-                comment = etree.SubElement(comments, "Comment", {"Operand": f".{diag}"})
+        # Update XML, only the texts that changed so an unchanged tag is not saved again
+        index = self.instances[self.current_instance]["comments"]
+        with self.journal.step("Edit"):
+            for diag, texts in diag_local.items():
                 for lan, text in texts.items():
-                    etree.SubElement(comment, "LocalizedComment", {"Lang": lan}).text = etree.CDATA(text)
+                    if index.get_text(diag, lan) != text:
+                        index.set_text(diag, lan, text)
         self.editing = False
         dpg.configure_item("edit_button", show=True)
         dpg.configure_item("save_button", show=False)
@@ -241,25 +423,10 @@ class App:
     def copy_table(self, sender):
         """Copy the entire diagnostics table to clipboard as tab-separated values."""
         table_data = []
-        # Get all table rows
-        children = dpg.get_item_children("diag_table", 1)  # 1 = slot for items (rows)
-        if children:
-            for row in children:
-                row_data = []
-                # Get children of the row (the cells)
-                row_children = dpg.get_item_children(row, 1)
-                if row_children:
-                    for cell in row_children:
-                        # Get the text value from each cell
-                        if dpg.get_item_type(cell) == "mvAppItemType::mvText":
-                            text = dpg.get_value(cell)
-                        elif dpg.get_item_type(cell) == "mvAppItemType::mvInputText":
-                            text = dpg.get_value(cell)
-                        else:
-                            text = ""
-                        row_data.append(text)
-                table_data.append("\t".join(row_data))
-        
+        for table_row in self.table_rows[:self.shown_rows]:
+            text_cell = table_row["input"] if self.editing else table_row["text"]
+            cells = [table_row["diag"], table_row["lan"], text_cell, table_row["aoi"]]
+            table_data.append("\t".join(dpg.get_value(cell) for cell in cells))
         # Join all rows with newlines
         clipboard_text = "\n".join(table_data)
         dpg.set_clipboard_text(clipboard_text)
@@ -293,56 +460,94 @@ class App:
             dpg.set_value(tag, new_value)
         dpg.delete_item("replace_popup")
 
+    def show_find_replace(self, sender):
+        if dpg.does_item_exist("find_window"):
+            dpg.focus_item("find_window")
+            return
+        with dpg.window(label="Find and replace", tag="find_window", width=760, height=480, on_close=lambda: dpg.delete_item("find_window")):
+            with dpg.group(horizontal=True):
+                dpg.add_input_text(tag="project_find_input", hint="Find", width=300)
+                dpg.add_checkbox(label="Regex", tag="project_find_regex")
+            dpg.add_input_text(tag="project_replace_input", hint="Replace", width=300)
+            with dpg.group(horizontal=True):
+                dpg.add_combo(["All types"] + list(self.AOIs.keys()), default_value="All types", tag="project_find_AOI", width=180)
+                dpg.add_combo(["All languages"] + LANGUAGES, default_value="All languages", tag="project_find_lan", width=130)
+                dpg.add_combo(["All words"] + DIAGNOSTIC_WORDS, default_value="All words", tag="project_find_word", width=130)
+            with dpg.group(horizontal=True):
+                dpg.add_button(label="Search", callback=self.search_project)
+                dpg.add_button(label="Replace all", callback=self.replace_project)
+                dpg.add_text("", tag="project_find_status")
+            with dpg.table(tag="project_find_table", header_row=True, resizable=True, clipper=True, scrollY=True, borders_innerH=True, borders_innerV=True, policy=dpg.mvTable_SizingStretchProp):
+                for label in ["Instance", "Operand", "Language", "Text", "New text"]:
+                    dpg.add_table_column(label=label)
+
+    def get_find_options(self):
+        """Return (find, replacement, regex, AOI_name, lan, diag_word) from the find and replace window."""
+        AOI_name = dpg.get_value("project_find_AOI")
+        lan = dpg.get_value("project_find_lan")
+        diag_word = dpg.get_value("project_find_word")
+        return (
+            dpg.get_value("project_find_input"),
+            dpg.get_value("project_replace_input"),
+            dpg.get_value("project_find_regex"),
+            None if AOI_name == "All types" else AOI_name,
+            None if lan == "All languages" else lan,
+            None if diag_word == "All words" else diag_word,
+        )
+
+    def find_matches(self):
+        """Return the matches of the find and replace window, or None if the pattern is not valid."""
+        if self.text_index is None:
+            self.text_index = TextIndex(self.AOIs, self.instances, self.validation)
+        find, _, regex, AOI_name, lan, diag_word = self.get_find_options()
+        try:
+            return self.text_index.search(find, regex, AOI_name, lan, diag_word)
+        except re.error as e:
+            dpg.set_value("project_find_status", f"Invalid regex: {e}")
+            return None
+
+    def search_project(self, sender=None):
+        matches = self.find_matches()
+        if matches is None:
+            return
+        find, replacement, regex, _, _, _ = self.get_find_options()
+        dpg.delete_item("project_find_table", children_only=True, slot=1)
+        for ins_name, diag, lan, text in matches[:PREVIEW_ROWS]:
+            with dpg.table_row(parent="project_find_table"):
+                dpg.add_text(ins_name)
+                dpg.add_text(diag)
+                dpg.add_text(lan)
+                dpg.add_text(text)
+                dpg.add_text(replace_text(text, find, replacement, regex))
+        status = f"{len(matches)} matches in {len(set(match[0] for match in matches))} instances"
+        if len(matches) > PREVIEW_ROWS:
+            status += f", showing the first {PREVIEW_ROWS}"
+        dpg.set_value("project_find_status", status)
+
+    def replace_project(self, sender):
+        """Replace the matches in the whole project and revalidate the instances that changed."""
+        if self.needs_full_project(self.replace_project, sender):
+            return
+        if self.editing:
+            self.cancel_edits(None)
+        matches = self.find_matches()
+        if matches is None:
+            return
+        find, replacement, regex, _, _, _ = self.get_find_options()
+        with self.journal.step("Replace"):
+            changed = replace_matches(self.instances, matches, find, replacement, regex)
+        self.refresh_instances(changed)
+        print(f"Replaced {len(matches)} texts in {len(changed)} instances")
+        self.search_project()
+
     def load_AOIs(self, xml_root):
-        res = {}
-        AOI_elements = xml_root.iter("AddOnInstructionDefinition")
-        for elem in AOI_elements:
-            AOI_name = elem.attrib.get("Name")
-            AOI_rev = elem.attrib.get("Revision")
-            for param in elem.find("Parameters"):
-                if param.attrib.get("Name") == "cDeviceID" and AOI_name != "MCP_Device":
-                    res[AOI_name] = {"Revision": AOI_rev}
-                    break
-            if AOI_name in res:
-                for param in elem.find("Parameters"): 
-                    AOI_diag_word = param.attrib.get("Name")
-                    if AOI_diag_word.lower() in DIAGNOSTIC_WORDS:
-                        for comment in param.find("Comments"):
-                            operand = comment.attrib.get("Operand")
-                            texts = {lan: "" for lan in LANGUAGES}
-                            for loc_comm in comment.findall("LocalizedComment"):
-                                lan = loc_comm.attrib.get("Lang")
-                                text = loc_comm.text.replace("\n", "")
-                                texts[lan] = text             
-                            res[AOI_name][f"{AOI_diag_word.lower()}{operand}"] = texts
-        return res
+        return l5x.load_AOIs(xml_root)
 
     def load_instances(self, xml_root):
-        res = {}
-        for tag in xml_root.find("Controller").find("Tags"):
-            if tag.attrib.get("DataType") in self.AOIs:
-                ins_name = tag.attrib.get("Name")
-                res[ins_name] = {
-                    "datatype": tag.attrib.get("DataType"),
-                    "XML_node": tag,
-                    "tree_node": 0,
-                }
-        return res
-
-    def get_instance_diagnostics(self, xml_node):
-        res = {}
-        comments = xml_node.find("Comments")
-        if comments is not None:
-            for comment in comments.findall("Comment"):
-                diag = comment.attrib.get("Operand").lower()[1:]
-                if any(word in diag for word in DIAGNOSTIC_WORDS):
-                    texts = {lan: "" for lan in LANGUAGES}
-                    for loc_comm in comment.findall("LocalizedComment"):
-                        lan = loc_comm.attrib.get("Lang")
-                        text = loc_comm.text.replace("\n", "")
-                        texts[lan] = text             
-                    res[diag] = texts
-        return res  
+        return l5x.load_instances(xml_root, self.AOIs)
+
+    def get_instance_diagnostics(self, ins_name):
+        return self.instances[ins_name]["comments"].diagnostics()
 
     def update_layout(self):
         try:
@@ -365,68 +570,177 @@ class App:
         dpg.set_item_width("right_panel", new_width)
         self.update_layout()
 
-    def load_callback(self, sender, file_data):
-        file_path = file_data['file_path_name']
-        try:
-            self.clear()
-            parser = etree.XMLParser(strip_cdata=False)
-            self.tree = etree.parse(file_path, parser)
-            xml_root = self.tree.getroot()
-            self.AOIs = self.load_AOIs(xml_root)
-            self.instances = self.load_instances(xml_root)
-            dpg.delete_item(self._window, children_only=True)
-            self.create_main_menu()
-            self.create_layout()
-            # Pre-load diagnostics
-            # Display corresponding diagnostics and remember selection
-            # Save Key language description for later use in diagnostics export
-            for ins_name in self.instances.keys():
-                self.display_diagnostics(ins_name, False)
-                # Local Diagnostics in XML
-                xml_node = self.instances[ins_name]["XML_node"]
-                # Create comments node if not existing
-                comments = xml_node.find("Comments",None)
-                if comments is not None:
-                    # Copy AOI diagnostics to instance
-                    for comment in comments.findall("Comment"):
-                        diag_word = comment.attrib.get("Operand").split(".")
-                        diag_word = diag_word[1].lower()
-                        if diag_word in DIAGNOSTIC_WORDS:
-                            # Remove not allowed languages
-                            for loc in comment.findall("LocalizedComment"):
-                                if loc.attrib.get("Lang") == KEY_LANGUAGE:
-                                    key = f"{ins_name}{comment.attrib.get("Operand").replace("\n", "")}"
-                                    self.key_language_desc[key] = loc.text.replace("\n", "") 
-            self.current_instance = list(self.instances.keys())[0]
-            self.display_diagnostics(self.current_instance)
-                       
-        except Exception as e:
-            print("Error loading file:", e)
+    def load_callback(self, sender, file_data, user_data=False):
+        self.load_file(file_data['file_path_name'], streaming=bool(user_data))
+
+    def load_file(self, file_path, streaming=False, use_cache=True, then=None):
+        """Load a project in the background, from the project cache if possible.
+
+        then() is called once the project has been swapped in.
+        """
+        cache = self.cache if use_cache else None
+
+        def work(progress):
+            start = time.perf_counter()
+            memory = PeakMemory()
+            key = None  # Content key of the file, known after a cache miss
+            if cache is not None:
+                report(progress, "cache")
+                data, key = cache.get(file_path)
+                if data is not None:
+                    # Only the data shown in the panels, the DOM is loaded when needed
+                    AOIs, instances, colors = cached_project(data)
+                    stats = {"mode": "cache", "load_time": time.perf_counter() - start, "peak_memory": memory.peak(),
+                             "library": {"conflicts": data["AOI_conflicts"]}}
+                    return None, AOIs, instances, stats, ValidationCache(AOIs, instances), colors
+            # Streaming mode keeps only the MCP instance tags, the tree is None then
+            tree, AOIs, instances, stats = l5x.load_project(file_path, streaming, progress, self.library)
+            # Pre-validate all instances once
+            validation = ValidationCache(AOIs, instances)
+            validation.validate_all(progress)
+            # A reload of a project opened from the cache (use_cache False) is cached already
+            if cache is not None:
+                report(progress, "cache")
+                conflicts = stats.get("library", {}).get("conflicts", [])
+                cache.put(file_path, project_data(AOIs, instances, validation, conflicts), key)
+            return tree, AOIs, instances, stats, validation, None
+
+        def done(result):
+            self.loaded(file_path, *result)
+            if then is not None:
+                then()
+
+        self.start_task("Loading", "Error loading file:", work, done)
+
+    def loaded(self, file_path, tree, AOIs, instances, stats, validation, colors=None):
+        """Swap in a project loaded by load_file."""
+        selected = self.current_instance
+        self.clear()
+        self.file_path = file_path
+        self.tree, self.AOIs, self.instances, self.validation = tree, AOIs, instances, validation
+        self.from_cache = colors is not None
+        if not self.from_cache:
+            self.saved_file = l5x.SavedFile(file_path, l5x.instance_versions(instances))
+            for ins_name, ins_data in instances.items():
+                self.journal.track(ins_name, ins_data["comments"])
+        print(f"Loaded {file_path} ({stats['mode']}) in {stats['load_time']:.2f} s, peak memory {format_size(stats['peak_memory'])}")
+        for conflict in stats.get("library", {}).get("conflicts", []):
+            print(f"Warning: AOI {conflict['AOI']} revision {conflict['revision']} differs from the library copy of the same revision")
+            self.AOI_conflicts.add(conflict["AOI"])
+        dpg.delete_item(self._window, children_only=True)
+        self.create_main_menu()
+        self.create_layout()
+        for ins_name in self.instances.keys():
+            self.mark_instance(ins_name, colors[ins_name] if self.from_cache else self.validation.color(ins_name))
+        self.instance_order = {ins_name: i for i, ins_name in enumerate(self.instances)}
+        self.name_index = NameIndex(self.instances.keys())
+        self.create_instance_groups()
+        if self.instances:
+            self.select_instance(selected if selected in self.instances else list(self.instances.keys())[0])
+
+    def needs_full_project(self, action, *args):
+        """Load the full project if it was opened from the cache, then run the action.
+
+        Returns True if the action has been postponed until the project is loaded.
+        """
+        if not self.from_cache:
+            return False
+        self.load_file(self.file_path, use_cache=False, then=lambda: action(*args))
+        return True
+
+    def clear_cache(self, sender):
+        if self.cache is not None:
+            self.cache.clear()
+
+    def clear_library(self, sender):
+        if self.library is not None:
+            self.library.clear()
+
+    def start_task(self, label, error_message, work, done):
+        """Run work(progress) on a worker thread, showing a progress window.
+
+        done(result) is called on the GUI thread once the work has finished,
+        so the UI only changes when the results are complete.
+        """
+        if self.task is not None:
+            print(f"{error_message} another task is still running")
             return
-    
+        task = {"label": label, "error_message": error_message, "progress": Progress(), "done": done, "result": None, "error": None}
+
+        def run_work():
+            try:
+                task["result"] = work(task["progress"])
+            except BaseException as e:
+                task["error"] = e
+
+        task["thread"] = threading.Thread(target=run_work, daemon=True)
+        self.task = task
+        with dpg.window(label=label, tag="progress_window", modal=True, no_close=True, width=360, height=100):
+            dpg.add_progress_bar(tag="progress_bar", default_value=0.0, width=-1)
+            dpg.add_button(label="Cancel", callback=self.cancel_task)
+        task["thread"].start()
+
+    def cancel_task(self, sender):
+        if self.task is not None:
+            self.task["progress"].cancel()
+
+    def poll_task(self):
+        """Update the progress window and finish the task once its thread is done."""
+        task = self.task
+        if task is None:
+            return
+        progress = task["progress"]
+        if task["thread"].is_alive():
+            dpg.set_value("progress_bar", progress.fraction)
+            dpg.configure_item("progress_bar", overlay=f"{progress.phase} {progress.fraction:.0%}")
+            return
+        self.task = None
+        dpg.delete_item("progress_window")
+        if isinstance(task["error"], Cancelled):
+            print(f"{task['label']} cancelled")
+        elif task["error"] is not None:
+            print(task["error_message"], task["error"])
+        else:
+            task["done"](task["result"])
+
     def create_main_menu(self):
         with dpg.menu_bar(parent=self._window):
             with dpg.menu(label="Main"):
                 dpg.add_menu_item(label="Load", callback=self.select_load_file)
+                dpg.add_menu_item(label="Load (streaming)", callback=self.select_load_file, user_data=True)
                 dpg.add_menu_item(label="Save", callback=self.select_save_file)
                 dpg.add_separator()
                 dpg.add_menu_item(label="Exit", callback=self.exit_app)
+            with dpg.menu(label="Edit"):
+                dpg.add_menu_item(label="Undo", shortcut="Ctrl+Z", callback=self.undo)
+                dpg.add_menu_item(label="Redo", shortcut="Ctrl+Y", callback=self.redo)
+                dpg.add_separator()
+                dpg.add_menu_item(label="Copy selected instances", callback=self.copy_selected_instances)
+                dpg.add_menu_item(label="Copy instances of AOI type", callback=self.copy_AOI_instances)
+                dpg.add_menu_item(label="Paste instances", callback=self.paste_instance_rows)
             with dpg.menu(label="Tools"):
                 dpg.add_menu_item(label="Fix all", callback=self.fix_all_diagnostics)
+                dpg.add_menu_item(label="Find and replace", callback=self.show_find_replace)
                 dpg.add_menu_item(label="Export Diag.", callback=self.select_export_diagnostics)
+                dpg.add_menu_item(label="Import Diag.", callback=self.select_import_diagnostics)
+                dpg.add_menu_item(label="Clear cache", callback=self.clear_cache)
+                dpg.add_menu_item(label="Clear AOI library", callback=self.clear_library)
             with dpg.menu(label="Help"):
                 dpg.add_menu_item(label="Help")
+                dpg.add_menu_item(label="Performance", callback=self.show_performance)
+                dpg.add_menu_item(label="Item counter", callback=self.show_item_counter)
                 dpg.add_separator()
                 dpg.add_menu_item(label="About", callback=self.test)
 
     def create_layout(self):
+        self.table_rows = []
+        self.shown_rows = 0
         with dpg.group(horizontal=True, parent=self._window):
             # INSTANCE PANEL
             with dpg.child_window(tag="left_panel", width=200, border=True):
-                with dpg.tree_node(tag="Instances", label="Instances", default_open=True):
-                    for (name, value) in self.instances.items():
-                        instance_node = dpg.add_selectable(label=f"{name} ({value["datatype"]})", callback=self.node_selected)
-                        self.instances[name]["tree_node"] = instance_node          
+                dpg.add_input_text(tag="instance_filter", hint="Filter", width=-1, callback=self.filter_instances)
+                # Groups by AOI type and status, see create_instance_groups
+                dpg.add_tree_node(tag="Instances", label="Instances", default_open=True)
             # DRAG HANDLE LEFT
             dpg.add_drag_float(label="", width=10, default_value=0, min_value=-500, max_value=500, callback=self.resize_left)
             # CENTRAL PANEL
@@ -443,7 +757,7 @@ class App:
                     dpg.add_button(label="Replace", callback=self.show_replace_popup, tag="replace_button", show=False)
                 # Scrollable area for the table
                 with dpg.child_window(tag="table_scroll_area", height=-1, border=False):
-                    with dpg.table(tag="diag_table", header_row=True, resizable=True, borders_innerH=True, borders_innerV=True, policy=dpg.mvTable_SizingStretchProp, freeze_rows=1):
+                    with dpg.table(tag="diag_table", header_row=True, resizable=True, borders_innerH=True, borders_innerV=True, policy=dpg.mvTable_SizingStretchProp, freeze_rows=1, clipper=True):
                         dpg.add_table_column(label="Diagnostic")
                         dpg.add_table_column(label="Language")
                         dpg.add_table_column(label="Instance Description")
@@ -454,15 +768,24 @@ class App:
             with dpg.child_window(tag="right_panel", width=200, border=True):
                 with dpg.tree_node(label="AOIs", default_open=True):
                     for aoi in self.AOIs.keys():
-                        dpg.add_text(f"{aoi} (v{self.AOIs[aoi]['Revision']})") 
+                        if aoi in self.AOI_conflicts:
+                            dpg.add_text(f"{aoi} (v{self.AOIs[aoi].revision}, differs from library)", color=COLOR_ORANGE)
+                        else:
+                            dpg.add_text(f"{aoi} (v{self.AOIs[aoi].revision})")
         self.update_layout()
 
     def run(self):
         dpg.create_context()
+        # THEMES
+        self.create_themes()
         # WINDOW
         self._window = dpg.add_window(tag="Primary Window", label="Example Window")
         # MAIN MENU
         self.create_main_menu()
+        # SHORTCUTS
+        with dpg.handler_registry():
+            dpg.add_key_press_handler(dpg.mvKey_Z, callback=self.key_pressed)
+            dpg.add_key_press_handler(dpg.mvKey_Y, callback=self.key_pressed)
         # VIEWPORT
         dpg.create_viewport(title=f'MCP Diagnostics Tool - v{VERSION}', width=800, height=640)
         dpg.setup_dearpygui()
@@ -470,115 +793,185 @@ class App:
         dpg.set_viewport_resize_callback(self.update_layout)
         dpg.set_primary_window("Primary Window", True)
         # below replaces, start_dearpygui()
+        last_count = 0.0
         while dpg.is_dearpygui_running() and self._keep_alive:
             # insert here any code you would like to run in the render loop
             # you can manually stop by using stop_dearpygui()
+            self.poll_task()
+            self.refresh_groups()
+            if time.monotonic() - last_count > 1.0:
+                self.update_item_counter()
+                self.update_performance()
+                last_count = time.monotonic()
             dpg.render_dearpygui_frame()
         dpg.destroy_context()
+        if self.profile_log:
+            profiler.write_json(self.profile_log)
         
     def save_callback(self, sender, file_data):
+        if self.needs_full_project(self.save_callback, sender, file_data):
+            return
         file_path = file_data['file_path_name']
-        try:
-            self.tree.write(file_path, encoding="utf-8", xml_declaration=True)
-        except Exception as e:
-            print("Error saving file:", e)
+        versions = l5x.instance_versions(self.instances)
+        # The tree is serialized by the worker: the comments cannot change while
+        # the progress window is shown, and undo waits for the task to finish
+        if self.saved_file is not None and self.saved_file.unchanged():
+            # Only the changed tags are written again, the rest of the file is copied as is
+            source = self.saved_file.file_path
+            changed = self.saved_file.changed(self.instances)
+
+            def work(progress):
+                tags = [(ins_name, l5x.tag_bytes(self.instances[ins_name]["XML_node"])) for ins_name in changed]
+                return l5x.splice_file(source, tags, file_path, progress)
+        elif self.tree is not None:
+            tree = self.tree
+            expected_size = os.path.getsize(self.file_path) if os.path.exists(self.file_path) else None
+            work = lambda progress: l5x.write_file(tree, file_path, progress, expected_size)
+        else:
+            print("Error saving file: the loaded file has changed on disk, load it again to save changes")
             return
-    
+
+        def done(result):
+            self.saved_file = l5x.SavedFile(file_path, versions)
+
+        self.start_task("Saving", "Error saving file:", work, done)
+
     def export_callback(self, sender, file_data):
+        if self.needs_full_project(self.export_callback, sender, file_data):
+            return
         file_path = file_data['file_path_name']
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                # Write header
-                f.write("#Logix Designer Project Documentation Localization File\n")
-                f.write("#Source: _Filename \n")				
-                f.write("#Date: 2026-01-01T00:00:00.0\n")
-                f.write("#Version: 1.00\n")
-                f.write("#Options: IncludeProjectContext\n")
-                f.write("#\n")
-                f.write("#** Do not modify the TYPE CONTEXT or KEY columns **\n")   
-                f.write("#\n")
-                f.write("TYPE\tCONTEXT\tKEY:en-GB [English (United Kingdom)]\ten-GB [English (United Kingdom)]\tsv-SE [svenska (Sverige)]\n")
-                # Write data
-                for ins_name in self.instances.keys():
-                    # Local Diagnostics in XML
-                    xml_node = self.instances[ins_name]["XML_node"]
-                    # Create comments node if not existing
-                    comments = xml_node.find("Comments",None)
-                    if comments is not None:
-                        # Copy AOI diagnostics to instance
-                        for comment in comments.findall("Comment"):
-                            diag_word = comment.attrib.get("Operand").split(".")
-                            diag_word = diag_word[1].lower()
-                            if diag_word in DIAGNOSTIC_WORDS:
-                                # Remove not allowed languages
-                                texts = {}
-                                key = f"{ins_name}{comment.attrib.get("Operand").replace("\n", "").upper()}"
-                                for loc in comment.findall("LocalizedComment"):
-                                    if loc.attrib.get("Lang") in LANGUAGES:
-                                        texts[loc.attrib.get("Lang")] = loc.text    
-                                if texts:
-                                    f.write(f"TAG\t{key}\t{self.key_language_desc.get(key, '')}\t{texts.get("en-GB", "").replace("\n", "")}\t{texts.get("sv-SE", "").replace("\n", "")}\n")
+        self.start_task("Exporting", "Error exporting diagnostics:", lambda progress: export_diagnostics(file_path, self.instances, progress), lambda result: None)
 
-        except Exception as e:
-            print("Error exporting diagnostics:", e)
+    def import_callback(self, sender, file_data):
+        if self.needs_full_project(self.import_callback, sender, file_data):
             return
+        if self.editing:
+            self.cancel_edits(None)
+        file_path = file_data['file_path_name']
+
+        def work(progress):
+            with self.journal.step("Import"):
+                return import_diagnostics(file_path, self.instances, progress)
+
+        self.start_task("Importing", "Error importing diagnostics:", work, self.imported)
+
+    def imported(self, result):
+        summary, changed = result
+        self.refresh_instances(changed)
+        print(f"Imported {summary['applied']} texts in {summary['instances']} instances from {summary['rows']} rows, "
+              f"{summary['unknown']} unknown operands, {summary['conflicts']} conflicts")
 
     def fix_diagnostics(self, sender):
         """Refresh diagnostics for the currently selected instance."""
-        # AOI Diagnostics
-        diag_aoi = self.AOIs[self.instances[self.current_instance]["datatype"]]
-        diag_aoi.pop("Revision", None)
-        # Local Diagnostics in XML
-        xml_node = self.instances[self.current_instance]["XML_node"]
-        # Create comments node if not existing
-        comments = xml_node.find("Comments")
-        if comments is None:
-            comments = etree.Element("Comments")
-            description = xml_node.find("Description")
-            alarm_conditions = xml_node.find("AlarmConditions")
-            if description is not None:
-                index = list(xml_node).index(description) + 1
-                xml_node.insert(index, comments)
-            elif alarm_conditions is not None:
-                index = list(xml_node).index(alarm_conditions) + 1
-                xml_node.insert(index, comments)
-            else:
-                xml_node.insert(0, comments)
-        # Copy AOI diagnostics to instance
-        for diag, texts_aoi in diag_aoi.items():
-            for comment in comments.findall("Comment"):
-                # Diag exists
-                if comment.attrib.get("Operand").lower()[1:] == diag:
-                    # Remove not allowed languages
-                    for loc in comment.findall("LocalizedComment"):
-                        if loc.attrib.get("Lang") not in LANGUAGES:
-                            comment.remove(loc)
-                    # Allowed language, check if needs update
-                    for lan, text_aoi in texts_aoi.items():
-                        for loc in comment.findall("LocalizedComment"):
-                            if loc.attrib.get("Lang") == lan:
-                                # Overwrite not allowed diagnostic text only
-                                if text_aoi in ["DO NOT USE", "ANVÄND EJ"] or text_aoi[:2] not in DIAG_TYPES or loc.text == "":
-                                    loc.text = etree.CDATA(text_aoi)
-                                break
-                        else:
-                            # Language missing, create it
-                            etree.SubElement(comment, "LocalizedComment", {"Lang": lan}).text = etree.CDATA(text_aoi)
-                    break
-            else:
-                # Diag does not exist, create it
-                comment = etree.SubElement(comments, "Comment", {"Operand": f".{diag}"})
-                for lan, text_aoi in texts_aoi.items():
-                    etree.SubElement(comment, "LocalizedComment", {"Lang": lan}).text = etree.CDATA(text_aoi)    
+        if self.needs_full_project(self.fix_diagnostics, sender):
+            return
+        with self.journal.step("Fix"), profiler.span("fix") as counts:
+            plan = fix_plan(self.validation.get_diag_aoi(self.instances[self.current_instance]["datatype"]))
+            counts.update(fix_instance(self.instances[self.current_instance]["comments"], plan, new_summary()))
         # Refresh displayed diagnostics
         self.display_diagnostics(self.current_instance)
 
     def fix_all_diagnostics(self, sender):
         """Fix diagnostics for all instances."""
-        for ins_name, status in self.instance_status.items():
-            if status == STATUS_OK:
-                self.current_instance = ins_name
-                self.fix_diagnostics(None)
+        if self.needs_full_project(self.fix_all_diagnostics, sender):
+            return
+        ins_names = [ins_name for ins_name, status in self.validation.validate_all().items() if status == STATUS_OK]
+        with self.journal.step("Fix all"):
+            summary = fix_instances(self.instances, self.validation, ins_names)
+        print(f"Fixed {summary['instances']} instances: {summary['created']} texts created, "
+              f"{summary['overwritten']} overwritten, {summary['removed']} removed")
+        # Refresh the UI once
+        for ins_name in self.instances.keys():
+            self.mark_instance(ins_name, self.validation.color(ins_name))
+        if self.current_instance is not None:
+            self.display_diagnostics(self.current_instance)
+        return summary
+
+    def refresh_instances(self, changed):
+        """Revalidate and refresh the instances whose comments changed."""
+        self.validation.validate_all()
+        for ins_name in changed:
+            self.mark_instance(ins_name, self.validation.color(ins_name))
+        if self.current_instance in changed:
+            self.display_diagnostics(self.current_instance)
+
+    def clear_selection(self):
+        for ins_name in self.selected_instances:
+            widget = self.instances[ins_name]["tree_node"]
+            if widget and dpg.does_item_exist(widget):
+                dpg.set_value(widget, False)
+        self.selected_instances = set()
+
+    def copy_selected_instances(self, sender):
+        """Copy the texts of the current instance and of those added with Ctrl+click."""
+        ins_names = self.selected_instances | ({self.current_instance} if self.current_instance is not None else set())
+        self.copy_instances(sorted(ins_names, key=self.instance_order.get))
+
+    def copy_AOI_instances(self, sender):
+        """Copy the texts of every instance of the AOI type of the current instance."""
+        if self.current_instance is None:
+            return
+        datatype = self.instances[self.current_instance]["datatype"]
+        self.copy_instances([ins_name for ins_name, ins_data in self.instances.items() if ins_data["datatype"] == datatype])
+
+    def copy_instances(self, ins_names):
+        if not ins_names:
+            return
+        dpg.set_clipboard_text(copy_instances(self.validation, ins_names))
+        print(f"Copied the texts of {len(ins_names)} instances")
+
+    def paste_instance_rows(self, sender):
+        """Paste rows copied with Copy instances, possibly edited in a spreadsheet, into the matching instances."""
+        if self.needs_full_project(self.paste_instance_rows, sender):
+            return
+        if self.editing:
+            self.cancel_edits(None)
+        text = dpg.get_clipboard_text()
+        if not text:
+            return
+
+        def work(progress):
+            with self.journal.step("Paste"):
+                return paste_instances(self.instances, self.validation, text, progress)
+
+        self.start_task("Pasting", "Error pasting diagnostics:", work, self.pasted)
+
+    def pasted(self, result):
+        summary, changed = result
+        self.refresh_instances(changed)
+        print(f"Pasted {summary['applied']} texts in {summary['instances']} instances from {summary['rows']} rows, "
+              f"{summary['unknown']} unknown operands")
+
+    def undo(self, sender=None):
+        """Undo the last change: an edit, a fix, Fix all, a replace, an import or a paste."""
+        self.run_journal(self.journal.undo, "Undo")
+
+    def redo(self, sender=None):
+        self.run_journal(self.journal.redo, "Redo")
+
+    def run_journal(self, action, label):
+        if self.task is not None:
+            print(f"Error on {label.lower()}: another task is still running")
+            return
+        if self.editing:
+            self.cancel_edits(None)
+        result = action()
+        if result is None:
+            return
+        step, changed = result
+        self.refresh_instances(changed)
+        print(f"{label} {step}: {len(changed)} instances changed")
+
+    def key_pressed(self, sender, key):
+        # The text inputs have their own undo while editing or typing in them
+        if self.editing or not dpg.is_key_down(dpg.mvKey_ModCtrl):
+            return
+        if any(dpg.does_item_exist(item) and dpg.is_item_active(item) for item in TEXT_INPUTS):
+            return
+        if key == dpg.mvKey_Z:
+            self.undo()
+        elif key == dpg.mvKey_Y:
+            self.redo()
 
     # callback runs when user attempts to connect attributes
     def link_callback(self, sender, app_data):
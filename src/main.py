@@ -1,5 +1,74 @@
-from gui.app import App
+import argparse
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MCP Diagnostics Tool")
+    parser.add_argument("--check", metavar="DIR", help="Validate all L5X files in DIR without opening the GUI")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="Compare the diagnostics of two revisions of an L5X file")
+    parser.add_argument("--report", metavar="FILE", default="report.json", help="Report file of --check or --diff, .json or .csv (default: report.json)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not search subdirectories")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming loader, for very large projects")
+    parser.add_argument("--serve", action="store_true", help="Run the validation service answering queries over local HTTP")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the validation service (default: 8765)")
+    parser.add_argument("--memory-budget", type=int, default=1024, help="Memory for the projects of the validation service in MB (default: 1024)")
+    parser.add_argument("--profile-log", metavar="FILE", help="Write the timing of the main phases to a JSON file on exit")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the project cache when loading files")
+    parser.add_argument("--cache-size", type=int, default=512, help="Project cache size limit in MB (default: 512)")
+    parser.add_argument("--no-library", action="store_true", help="Do not use the library of AOI definitions parsed before")
+    return parser.parse_args()
+
+def open_library(args):
+    if args.no_library:
+        return None
+    from core.library import AOILibrary
+    try:
+        return AOILibrary()
+    except Exception as e:
+        print("Error opening AOI library:", e)
+        return None
+
+def run_check(args):
+    from core.batch import check_directory, write_report, summarize
+    results = check_directory(args.check, workers=args.workers, recursive=not args.no_recursive, streaming=args.stream,
+                              library=open_library(args))
+    write_report(results, args.report)
+    summary = summarize(results)
+    print(f"Checked {summary['files']} files, {summary['instances']} instances, "
+          f"{summary['issues']} with issues, {summary['failed_files']} failed. Report: {args.report}")
+    if summary["AOI_conflicts"]:
+        print(f"Warning: {summary['AOI_conflicts']} AOI definitions differ from the library copy of the same revision, see the report")
+    return 1 if summary["issues"] or summary["failed_files"] else 0
+
+def run_diff(args):
+    from core.diff import compare_projects, write_diff
+    diff = compare_projects(*args.diff)
+    write_diff(diff, args.report)
+    summary = diff["summary"]
+    changes = ", ".join(f"{summary[change]} {change.replace('_', ' ')}" for change in
+                        ["AOI_added", "AOI_removed", "AOI_changed", "instance_added", "instance_removed",
+                         "text_added", "text_removed", "text_changed", "status"] if change in summary)
+    print(f"Compared {summary['compared']} of {summary['new_instances']} instances: {changes or 'no changes'}. Report: {args.report}")
+    return 0
 
 if __name__ == "__main__":
-    app = App()
+    args = parse_args()
+    if args.check:
+        sys.exit(run_check(args))
+    if args.diff:
+        sys.exit(run_diff(args))
+    if args.serve:
+        from core.service import serve
+        serve(args.port, args.memory_budget * 1024 * 1024, library=open_library(args))
+        sys.exit(0)
+    from gui.app import App
+    cache = None
+    if not args.no_cache:
+        from core.cache import ProjectCache
+        try:
+            cache = ProjectCache(size_limit=args.cache_size * 1024 * 1024)
+        except Exception as e:
+            print("Error opening project cache:", e)
+    app = App(profile_log=args.profile_log, cache=cache, library=open_library(args))
     app.run()